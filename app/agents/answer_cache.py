@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.clients.http_client import get_http_client
+from app.clients.embedding_cache import aembed_cached
+from app.clients.qdrant_client import qdrant_headers, qdrant_url
+from app.clients.redis_client import count_stat, get_async_redis
+from app.config import settings
+from app.utils.hashing import make_chunk_id
+from app.utils.tracing import traced
+
+log = logging.getLogger(__name__)
+
+CORPUS_VERSION_KEY = "corpus_version"
+STATS_KEY = "answer_cache:stats"
+
+_semantic_collection_ready = False
+
+
+def normalize_question(question: str) -> str:
+    """
+    Lowercase, unify ё/е, collapse whitespace and drop trailing punctuation.
+    """
+    text = question.strip().lower().replace("ё", "е")
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip(" ?!.…")
+
+
+def question_hash(question: str) -> str:
+    return hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()
+
+
+async def cache_version(redis_client) -> str:
+    """
+    Entries are only valid for the current corpus (bumped by ingest) and models.
+    """
+    corpus = await redis_client.get(CORPUS_VERSION_KEY) or "0"
+    raw = f"{settings.OLLAMA_MODEL_NAME}|{settings.OLLAMA_EMBED_MODEL_NAME}|{corpus}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def bump_corpus_version(redis_client, version: str) -> None:
+    """
+    Called after ingest: invalidates every cached answer of the previous corpus.
+    """
+    redis_client.set(CORPUS_VERSION_KEY, version)
+    try:
+        httpx.delete(
+            qdrant_url(f"collections/{settings.QDRANT_COLLECTION_ANSWER_CACHE}"),
+            headers=qdrant_headers(),
+            timeout=30.0,
+        )
+    except Exception as exc:
+        log.warning(f"[cache] failed to drop semantic cache collection: {exc}")
+
+
+def _exact_key(version: str, qhash: str) -> str:
+    return f"llm_cache:{version}:{qhash}"
+
+
+async def _semantic_lookup(version: str, vector: List[float]) -> Optional[str]:
+    url = qdrant_url(f"collections/{settings.QDRANT_COLLECTION_ANSWER_CACHE}/points/search")
+    payload = {
+        "vector": vector,
+        "limit": 1,
+        "with_payload": True,
+        "score_threshold": settings.ANSWER_CACHE_SEMANTIC_THRESHOLD,
+        "filter": {"must": [{"key": "version", "match": {"value": version}}]},
+    }
+    resp = await get_http_client().post(url, json=payload, headers=qdrant_headers(), timeout=30.0)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    hits = resp.json().get("result") or []
+    if not hits:
+        return None
+    return (hits[0].get("payload") or {}).get("question_hash")
+
+
+async def _semantic_store(version: str, qhash: str, question: str, vector: List[float]) -> None:
+    global _semantic_collection_ready
+    client = get_http_client()
+    headers = qdrant_headers()
+    collection_url = qdrant_url(f"collections/{settings.QDRANT_COLLECTION_ANSWER_CACHE}")
+    if not _semantic_collection_ready:
+        existing = await client.get(collection_url, headers=headers, timeout=30.0)
+        if existing.status_code == 404:
+            resp = await client.put(
+                collection_url,
+                json={"vectors": {"size": len(vector), "distance": "Cosine"}},
+                headers=headers,
+                timeout=30.0,
+            )
+            resp.raise_for_status()
+        _semantic_collection_ready = True
+    point = {
+        "id": make_chunk_id(f"{version}:{qhash}"),
+        "vector": vector,
+        "payload": {"version": version, "question_hash": qhash, "question": question},
+    }
+    resp = await client.put(
+        f"{collection_url}/points?wait=false", json={"points": [point]}, headers=headers, timeout=30.0
+    )
+    if resp.status_code == 404:
+        # Collection was dropped by a re-ingest; recreate it on the next store.
+        _semantic_collection_ready = False
+    resp.raise_for_status()
+
+
+@traced("answer_cache.lookup")
+async def lookup(question: str) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+    """
+    Returns (cached_result, question_vector). The vector is handed back so that
+    `store` does not embed the question a second time.
+    """
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None, None
+    try:
+        redis_client = get_async_redis()
+        version = await cache_version(redis_client)
+        cached = await redis_client.get(_exact_key(version, question_hash(question)))
+    except Exception as exc:
+        log.warning(f"[cache] exact lookup failed: {exc}")
+        return None, None
+
+    if cached:
+        await count_stat(STATS_KEY, "hit")
+        log.info("[cache] hit for question")
+        return json.loads(cached), None
+
+    vector = None
+    if settings.ANSWER_CACHE_SEMANTIC_ENABLED:
+        try:
+            vector = (await aembed_cached([normalize_question(question)]))[0]
+            near_hash = await _semantic_lookup(version, vector)
+            if near_hash:
+                cached = await redis_client.get(_exact_key(version, near_hash))
+                if cached:
+                    await count_stat(STATS_KEY, "near_hit")
+                    log.info("[cache] near-duplicate hit for question")
+                    return json.loads(cached), vector
+        except Exception as exc:
+            log.warning(f"[cache] semantic lookup failed: {exc}")
+
+    await count_stat(STATS_KEY, "miss")
+    return None, vector
+
+
+@traced("answer_cache.store")
+async def store(question: str, result: Dict[str, Any], vector: Optional[List[float]] = None) -> None:
+    if not settings.ANSWER_CACHE_ENABLED or not result.get("answer"):
+        return
+    try:
+        redis_client = get_async_redis()
+        version = await cache_version(redis_client)
+        qhash = question_hash(question)
+        await redis_client.set(
+            _exact_key(version, qhash),
+            json.dumps(result, ensure_ascii=False),
+            ex=settings.ANSWER_CACHE_TTL_SECONDS,
+        )
+        log.info("[cache] stored result for question")
+    except Exception as exc:
+        log.warning(f"[cache] store failed: {exc}")
+        return
+
+    if settings.ANSWER_CACHE_SEMANTIC_ENABLED:
+        try:
+            if vector is None:
+                vector = (await aembed_cached([normalize_question(question)]))[0]
+            await _semantic_store(version, qhash, question, vector)
+        except Exception as exc:
+            log.warning(f"[cache] semantic store failed: {exc}")
+
+
+async def get_stats() -> Dict[str, Any]:
+    redis_client = get_async_redis()
+    raw = await redis_client.hgetall(STATS_KEY)
+    stats = {field: int(raw.get(field, 0)) for field in ("hit", "near_hit", "miss")}
+    stats["version"] = await cache_version(redis_client)
+    return stats
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.agents.answer_cache import normalize_question
+from app.agents.graph import run_agent
+from app.agents.router import THEORY_COLLECTIONS, route
+from app.agents.tools import prefetch_collection_searches
+from app.clients.embedding_cache import aembed_cached
+from app.clients.redis_client import get_async_redis
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+_jobs: Set[asyncio.Task] = set()
+
+
+def dedupe(questions: List[str]) -> Dict[str, str]:
+    """
+    normalized question -> first original spelling, in input order.
+    """
+    unique: Dict[str, str] = {}
+    for question in questions:
+        unique.setdefault(normalize_question(question), question)
+    return unique
+
+
+async def run_batch(
+    questions: List[str],
+    concurrency: int | None = None,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """
+    Answers many questions at once:
+    1. duplicates (same normalized text) are answered once;
+    2. every question is embedded in one request (warming the embedding
+       cache for the answer cache lookup and the router);
+    3. routed questions get their book searched with one Qdrant batch search
+       per collection, which the graph runs then reuse;
+    4. graph runs go through `run_agent` with at most `concurrency` at a time.
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    unique = dedupe(questions)
+    originals = list(unique.values())
+
+    t0 = time.perf_counter()
+    try:
+        await aembed_cached(list(dict.fromkeys(originals + list(unique))))
+    except Exception as exc:
+        log.warning(f"[batch] embedding prefetch failed: {exc}")
+    timings["embed"] = time.perf_counter() - t0
+
+    if settings.ROUTER_ENABLED:
+        t0 = time.perf_counter()
+        theories = await asyncio.gather(*(route(q) for q in originals), return_exceptions=True)
+        timings["route"] = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        await prefetch_collection_searches(
+            [(THEORY_COLLECTIONS[t], q) for q, t in zip(originals, theories) if isinstance(t, str)]
+        )
+        timings["search"] = time.perf_counter() - t0
+
+    semaphore = asyncio.Semaphore(min(concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_MAX_CONCURRENCY))
+    answers: Dict[str, Dict[str, Any]] = {}
+
+    async def answer(question: str) -> None:
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                item = dict(await run_agent(question), error=None)
+            except Exception as exc:
+                log.error(f"[batch] question failed: {exc}")
+                item = {"answer": "", "citations": [], "theory": None, "error": str(exc) or type(exc).__name__}
+            item["seconds"] = round(time.perf_counter() - t0, 3)
+        answers[question] = item
+        if on_progress is not None:
+            await on_progress(len(answers))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(answer(q) for q in originals))
+    timings["answer"] = time.perf_counter() - t0
+    timings["total"] = time.perf_counter() - started
+
+    log.info(f"[batch] {len(questions)} questions ({len(originals)} unique) in {timings['total']:.1f}s")
+    return {
+        "results": [dict(answers[unique[normalize_question(q)]], question=q) for q in questions],
+        "unique_questions": len(originals),
+        "duplicates": len(questions) - len(originals),
+        "timings": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+    }
+
+
+def _job_key(job_id: str) -> str:
+    return f"batch_job:{job_id}"
+
+
+async def _run_job(job_id: str, questions: List[str], concurrency: int | None) -> None:
+    redis_client = get_async_redis()
+    key = _job_key(job_id)
+
+    async def progress(completed: int) -> None:
+        await redis_client.hset(key, "completed", completed)
+
+    await redis_client.hset(key, "status", "running")
+    try:
+        result = await run_batch(questions, concurrency, on_progress=progress)
+    except Exception as exc:
+        log.error(f"[batch] job {job_id} failed: {exc}")
+        await redis_client.hset(key, mapping={"status": "failed", "error": str(exc)})
+        return
+    await redis_client.hset(
+        key,
+        mapping={"status": "done", "result": json.dumps(result, ensure_ascii=False, default=str)},
+    )
+    await redis_client.expire(key, settings.BATCH_JOB_TTL_SECONDS)
+
+
+async def start_job(questions: List[str], concurrency: int | None = None) -> str:
+    """
+    Runs the batch in the background of this worker; progress and result are
+    kept in Redis (batch_job:<id>) for BATCH_JOB_TTL_SECONDS.
+    """
+    job_id = uuid.uuid4().hex
+    redis_client = get_async_redis()
+    key = _job_key(job_id)
+    await redis_client.hset(
+        key,
+        mapping={
+            "status": "queued",
+            "questions": len(questions),
+            "total": len(dedupe(questions)),
+            "completed": 0,
+            "created_at": time.time(),
+        },
+    )
+    await redis_client.expire(key, settings.BATCH_JOB_TTL_SECONDS)
+    task = asyncio.create_task(_run_job(job_id, questions, concurrency))
+    _jobs.add(task)
+    task.add_done_callback(_jobs.discard)
+    return job_id
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    raw = await get_async_redis().hgetall(_job_key(job_id))
+    if not raw:
+        return None
+    return {
+        "job_id": job_id,
+        "status": raw.get("status"),
+        "questions": int(raw.get("questions", 0)),
+        "total": int(raw.get("total", 0)),
+        "completed": int(raw.get("completed", 0)),
+        "error": raw.get("error"),
+        "result": json.loads(raw["result"]) if raw.get("result") else None,
+    }
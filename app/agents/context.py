@@ -0,0 +1,137 @@
+import json
+import re
+from typing import Any, Dict, List, Set
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+
+from app.config import settings
+from app.utils.tokens import estimate_tokens
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+|\n+")
+_WORD_RE = re.compile(r"\w+")
+_STEM = 5  # crude stemming: compare word prefixes ("systems" ~ "system")
+
+CHUNK_FIELDS = ("chunk_id", "book_id", "theory", "page_start", "page_end", "score")
+
+
+def query_terms(text: str) -> Set[str]:
+    return {w[:_STEM] for w in _WORD_RE.findall(text.lower()) if len(w) > 2}
+
+
+def extract_passages(text: str, query: str, max_tokens: int) -> str:
+    """
+    Keep the sentences sharing most terms with the query (in original order)
+    until `max_tokens` is reached; falls back to the leading text.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    sentences = [s for s in _SENTENCE_RE.split(text) if s.strip()]
+    wanted = query_terms(query)
+    scored = [(len(wanted & query_terms(s)), i, s) for i, s in enumerate(sentences)]
+    if not any(score for score, _, _ in scored):
+        scored = [(0, i, s) for i, s in enumerate(sentences)]
+    else:
+        scored = sorted((item for item in scored if item[0]), key=lambda item: (-item[0], item[1]))
+
+    picked = []
+    total = 0
+    for _, i, sentence in scored:
+        n = estimate_tokens(sentence)
+        if total + n > max_tokens:
+            if picked:
+                continue
+            sentence = " ".join(sentence.split()[:max_tokens])
+            n = estimate_tokens(sentence)
+        picked.append((i, sentence))
+        total += n
+    picked.sort()
+    return " … ".join(sentence for _, sentence in picked)
+
+
+def shown_chunks(messages: List[BaseMessage]) -> List[Dict]:
+    """
+    Chunks whose text was shown to the LLM in tool results, first showing wins.
+    """
+    shown: Dict[str, Dict] = {}
+    for m in messages:
+        if isinstance(m, ToolMessage):
+            for item in _parse_chunks(m.content):
+                if item.get("chunk_id") and item.get("text"):
+                    shown.setdefault(item["chunk_id"], item)
+    return list(shown.values())
+
+
+def seen_chunk_ids(messages: List[BaseMessage]) -> Set[str]:
+    return {item["chunk_id"] for item in shown_chunks(messages)}
+
+
+def _parse_chunks(content: Any) -> List[Dict]:
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except ValueError:
+            return []
+    if not isinstance(content, list):
+        return []
+    return [item for item in content if isinstance(item, dict)]
+
+
+def is_chunk_list(result: Any) -> bool:
+    return isinstance(result, list) and bool(result) and all(
+        isinstance(item, dict) and "chunk_id" in item for item in result
+    )
+
+
+def compact_chunks(chunks: List[Dict], query: str, seen: Set[str]) -> List[Dict]:
+    """
+    Tool result as it re-enters the LLM: chunks already shown earlier in the
+    conversation keep only their metadata, new ones keep the passages that
+    are relevant to the query (TOOL_CHUNK_MAX_TOKENS each). `seen` is updated.
+    """
+    compacted = []
+    for chunk in chunks:
+        item = {field: chunk.get(field) for field in CHUNK_FIELDS}
+        if isinstance(item["score"], float):
+            item["score"] = round(item["score"], 3)
+        if chunk["chunk_id"] in seen:
+            item["note"] = "already shown above"
+        else:
+            item["text"] = extract_passages(chunk.get("text") or "", query, settings.TOOL_CHUNK_MAX_TOKENS)
+            seen.add(chunk["chunk_id"])
+        compacted.append(item)
+    return compacted
+
+
+def _stub(message: ToolMessage) -> ToolMessage:
+    chunks = _parse_chunks(message.content)
+    if chunks:
+        content = json.dumps(
+            [dict({f: c.get(f) for f in CHUNK_FIELDS if f != "score"}, note="text omitted") for c in chunks],
+            ensure_ascii=False,
+        )
+    else:
+        content = "[omitted]"
+    return ToolMessage(content=content, tool_call_id=message.tool_call_id, name=message.name)
+
+
+def fit_tool_context(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    View of the history for one LLM call with tool output capped at
+    TOOL_CONTEXT_MAX_TOKENS: the oldest tool results are reduced to citation
+    stubs first. Results of the latest tool round are never stubbed.
+    """
+    budget = settings.TOOL_CONTEXT_MAX_TOKENS
+    tool_idx = [i for i, m in enumerate(messages) if isinstance(m, ToolMessage)]
+    sizes = {i: estimate_tokens(str(messages[i].content)) for i in tool_idx}
+    total = sum(sizes.values())
+    if total <= budget:
+        return messages
+
+    last_ai = max((i for i, m in enumerate(messages) if isinstance(m, AIMessage)), default=-1)
+    view = list(messages)
+    for i in tool_idx:
+        if total <= budget or i > last_ai:
+            break
+        view[i] = _stub(messages[i])
+        total += estimate_tokens(str(view[i].content)) - sizes[i]
+    return view
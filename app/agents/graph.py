@@ -1,106 +1,341 @@
 import ast
+import asyncio
 import json
-import hashlib
-from typing import Any, Dict, List
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
 from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
 from langgraph.graph import END, StateGraph
+from prometheus_client import Counter
 
+from app.agents import answer_cache, language, sessions, single_flight
+from app.agents.context import compact_chunks, fit_tool_context, is_chunk_list, seen_chunk_ids, shown_chunks
 from app.agents.state import AgentState
-from app.agents.prompts import SYSTEM_PROMPT
-from app.agents.tools import TOOLS
-from app.clients.ollama_client import get_llm
-from app.clients.redis_client import get_redis
-
-_executor: Runnable | None = None
-CACHE_TTL_SECONDS = 24 * 60 * 60
+from app.agents.prompts import ANSWER_NOW_PROMPT, STOP_REASONS, SYSTEM_PROMPT
+from app.agents.router import THEORY_TOOLS, route
+from app.agents.tools import TOOLS, fetch_chunks
+from app.clients.llm_scheduler import PRIORITY_CONTINUATION, PRIORITY_NEW, get_llm_scheduler
+from app.clients.ollama_client import close_llm, get_llm
+from app.clients.redis_client import count_stat
+from app.config import settings
+from app.utils.tracing import record_llm_usage, span, traced
 
+log = logging.getLogger(__name__)
 
+_executor: Runnable | None = None
+_llm_with_tools: Runnable | None = None
+
+LOOP_STOPS = Counter(
+    "agent_loop_stops_total",
+    "Tool loops ended by the agent's budget or early-stop policy instead of the model, by reason.",
+    ["reason"],
+)
+
+
+def get_llm_with_tools() -> Runnable:
+    """
+    Tool binding built once; the bound runnable shares the process-wide client.
+    """
+    global _llm_with_tools
+    if _llm_with_tools is None:
+        _llm_with_tools = get_llm().bind_tools(TOOLS)
+    return _llm_with_tools
+
+
+async def close_llm_clients() -> None:
+    global _llm_with_tools
+    _llm_with_tools = None
+    await close_llm()
+
+
+def _prompt_prefix(state: AgentState) -> List[Any]:
+    # Stable prefix for Ollama's prompt cache: system prompt, then chunks pinned
+    # in earlier turns (only appended to), then earlier turns, then this one.
+    system_msg = SystemMessage(content=SYSTEM_PROMPT + sessions.context_block(state.get("pinned") or []))
+    return [system_msg] + state.get("history", [])
+
+
+def _remaining(state: AgentState) -> float:
+    return state["deadline"] - time.monotonic()
+
+
+def _budget_stop(state: AgentState, round_stats: Dict[str, Any] | None = None) -> str | None:
+    """
+    Why the tool loop should end now, or None to let the model go on:
+    deadline / max_rounds when the per-request budget is spent; after a
+    search round also confident (top chunk score >= AGENT_STOP_SCORE) and
+    no_new_chunks (every chunk found was already shown).
+    """
+    if _remaining(state) <= 0:
+        return "deadline"
+    if state.get("iterations", 0) >= settings.AGENT_MAX_TOOL_ROUNDS:
+        return "max_rounds"
+    if round_stats and round_stats["chunks"]:
+        if round_stats["top_score"] is not None and round_stats["top_score"] >= settings.AGENT_STOP_SCORE:
+            return "confident"
+        if not round_stats["new_chunks"]:
+            return "no_new_chunks"
+    return None
+
+
+@traced("node.agent")
 async def call_llm_with_tools(state: AgentState) -> AgentState:
-    llm = get_llm().bind_tools(TOOLS)
+    llm = get_llm_with_tools()
     messages = state["messages"]
-    system_msg = SystemMessage(content=SYSTEM_PROMPT)
     # Log incoming turn
     if messages:
         last_user = [m for m in messages if isinstance(m, HumanMessage)][-1]
-        import logging
-        logging.getLogger(__name__).info(f"[graph] LLM step, last user: {last_user.content}")
-    result = await llm.ainvoke([system_msg] + messages)
+        log.info(f"[graph] LLM step, last user: {last_user.content}")
+    # Steps of a run that already went through tools are served first.
+    priority = PRIORITY_CONTINUATION if state.get("iterations", 0) else PRIORITY_NEW
+
+    async def step() -> Any:
+        async with get_llm_scheduler().slot(priority):
+            with span("llm.chat", call="agent") as attrs:
+                # Older tool output is reduced to citation stubs once over budget.
+                result = await llm.ainvoke(_prompt_prefix(state) + fit_tool_context(messages))
+                attrs.update(record_llm_usage("agent", result.response_metadata))
+                return result
+
+    try:
+        result = await asyncio.wait_for(step(), timeout=max(_remaining(state), 0.001))
+    except asyncio.TimeoutError:
+        log.warning(f"[graph] LLM step cut by the {settings.AGENT_DEADLINE_SECONDS:.0f}s deadline")
+        state["stop_reason"] = "deadline"
+        return state
     tool_calls = getattr(result, "tool_calls", None) or []
-    logging.getLogger(__name__).info(f"[graph] LLM responded, tool_calls={ [tc.get('name') for tc in tool_calls] if tool_calls else []}")
+    log.info(f"[graph] LLM responded, tool_calls={ [tc.get('name') for tc in tool_calls] if tool_calls else []}")
     state["messages"] = messages + [result]
+    if tool_calls:
+        state["stop_reason"] = _budget_stop(state)
     return state
 
 
-async def execute_tools(state: AgentState) -> AgentState:
+@traced("node.answer")
+async def answer_now(state: AgentState) -> AgentState:
+    """
+    Forced last step once the loop is stopped by the budget or the
+    early-stop policy: one call without tools, answering from the chunks
+    found so far. Its latency is the only part not covered by the deadline.
+    """
+    reason = state.get("stop_reason") or "deadline"
+    LOOP_STOPS.labels(reason).inc()
     messages = state["messages"]
-    last = messages[-1]
+    if getattr(messages[-1], "tool_calls", None):
+        messages = messages[:-1]  # tool calls that will not be run
+    log.info(f"[graph] tool loop stopped ({reason}) after {state.get('iterations', 0)} rounds, answering now")
+    instruction = SystemMessage(content=ANSWER_NOW_PROMPT.format(reason=STOP_REASONS[reason]))
+    async with get_llm_scheduler().slot(PRIORITY_CONTINUATION):
+        with span("llm.chat", call="answer") as attrs:
+            result = await get_llm().ainvoke(_prompt_prefix(state) + fit_tool_context(messages) + [instruction])
+            attrs.update(record_llm_usage("answer", result.response_metadata))
+    state["messages"] = messages + [result]
+    return state
 
-    tool_calls = getattr(last, "tool_calls", None) or []
-    if not tool_calls:
-        return state
 
-    tool_map = {t.name: t for t in TOOLS}
-    import logging
-
-    for tc in tool_calls:
-        name = tc.get("name")
-        args = tc.get("args") or tc.get("arguments") or {}
-        call_id = tc.get("id", name)
-
-        tool = tool_map.get(name)
-        if tool is None:
-            messages.append(
-                ToolMessage(
-                    content=f"Unknown tool {name}",
-                    tool_call_id=call_id,
-                    name=name or "unknown_tool",
-                )
+async def _invoke_tool(tool: BaseTool, args: Dict[str, Any]) -> Any:
+    if getattr(tool, "coroutine", None) is None:
+        # Sync tool: keep it off the event loop.
+        return await asyncio.to_thread(tool.invoke, args)
+    return await tool.ainvoke(args)
+
+
+async def _run_tool_call(
+    tc: Dict[str, Any],
+    tool_map: Dict[str, BaseTool],
+    semaphore: asyncio.Semaphore,
+    timeout: float = settings.TOOL_TIMEOUT_SECONDS,
+) -> Any:
+    """
+    Raw tool result, or a ready error ToolMessage.
+    """
+    timeout = max(min(timeout, settings.TOOL_TIMEOUT_SECONDS), 0.001)
+    name = tc.get("name")
+    args = tc.get("args") or tc.get("arguments") or {}
+    call_id = tc.get("id", name)
+
+    tool = tool_map.get(name)
+    if tool is None:
+        return ToolMessage(
+            content=f"Unknown tool {name}",
+            tool_call_id=call_id,
+            name=name or "unknown_tool",
+        )
+
+    async with semaphore:
+        log.info(f"[graph] invoking tool {name} args={args}")
+        try:
+            with span(f"tool.{name}"):
+                result = await asyncio.wait_for(_invoke_tool(tool, args), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.error(f"[graph] tool {name} timed out after {timeout:.1f}s")
+            return ToolMessage(
+                content=f"Tool {name} timed out after {timeout:.0f} seconds",
+                tool_call_id=call_id,
+                name=name,
             )
-            continue
+        except Exception as exc:
+            log.error(f"[graph] tool {name} failed: {exc}")
+            return ToolMessage(content=f"Tool {name} failed: {exc}", tool_call_id=call_id, name=name)
+        log.info(f"[graph] tool {name} done")
+    return result
 
-        logging.getLogger(__name__).info(f"[graph] invoking tool {name} args={args}")
-        result = await tool.ainvoke(args)
-        logging.getLogger(__name__).info(f"[graph] tool {name} done")
 
+def _append_tool_results(
+    messages: List[Any],
+    tool_calls: List[Dict[str, Any]],
+    results: List[Any],
+    pinned_ids: Set[str] = frozenset(),
+) -> Dict[str, Any]:
+    """
+    Appends the results as ToolMessages; returns what the round found for
+    the early-stop policy: chunks, new_chunks (not shown before), top_score.
+    """
+    seen = seen_chunk_ids(messages) | pinned_ids
+    question = [m for m in messages if isinstance(m, HumanMessage)][-1].content
+    stats: Dict[str, Any] = {"chunks": 0, "new_chunks": 0, "top_score": None}
+    for tc, result in zip(tool_calls, results):
+        if isinstance(result, ToolMessage):
+            messages.append(result)
+            continue
+        if is_chunk_list(result):
+            query = (tc.get("args") or {}).get("query") or question
+            result = compact_chunks(result, query, seen)
+            scores = [item["score"] for item in result if isinstance(item.get("score"), (int, float))]
+            stats["chunks"] += len(result)
+            stats["new_chunks"] += sum(1 for item in result if "text" in item)
+            if scores:
+                top = max(scores)
+                stats["top_score"] = top if stats["top_score"] is None else max(stats["top_score"], top)
         messages.append(
             ToolMessage(
                 content=json.dumps(result, ensure_ascii=False),
-                tool_call_id=call_id,
-                name=name,
+                tool_call_id=tc.get("id", tc.get("name")),
+                name=tc.get("name"),
             )
         )
+    return stats
+
+
+def _pinned_ids(state: AgentState) -> Set[str]:
+    return {chunk["chunk_id"] for chunk in state.get("pinned") or []}
+
+
+@traced("node.tools")
+async def execute_tools(state: AgentState) -> AgentState:
+    messages = state["messages"]
+    last = messages[-1]
+
+    tool_calls = getattr(last, "tool_calls", None) or []
+    if not tool_calls:
+        return state
+
+    tool_map = {t.name: t for t in TOOLS}
+    # Per-request cap: one request's fan-out cannot monopolize Qdrant/Ollama.
+    semaphore = asyncio.Semaphore(settings.TOOL_MAX_CONCURRENCY_PER_REQUEST)
+    # gather keeps the original call order regardless of completion order.
+    results = await asyncio.gather(
+        *(_run_tool_call(tc, tool_map, semaphore, _remaining(state)) for tc in tool_calls)
+    )
+    round_stats = _append_tool_results(messages, tool_calls, results, _pinned_ids(state))
+
+    if state.get("theory") is None:
+        theories = {theory for theory, name in THEORY_TOOLS.items() for tc in tool_calls if tc.get("name") == name}
+        if len(theories) == 1:
+            state["theory"] = theories.pop()
 
     state["messages"] = messages
     state["iterations"] = state.get("iterations", 0) + 1
+    state["stop_reason"] = _budget_stop(state, round_stats)
     return state
 
 
-def should_continue(state: AgentState) -> str:
+@traced("node.route")
+async def route_question(state: AgentState) -> AgentState:
+    """
+    Router-first: when the question clearly belongs to one book, search it
+    right away and hand the chunks to the first LLM call (as a regular tool
+    call/result pair), so no LLM round trip is spent on picking the tool.
+    Low confidence leaves the state untouched and the LLM tool loop decides.
+    """
+    if not settings.ROUTER_ENABLED:
+        return state
     messages = state["messages"]
-    last = messages[-1]
-    tool_calls = getattr(last, "tool_calls", None) or []
-    if tool_calls:
-        return "tools"
-    if state.get("iterations", 0) > 3:
-        return "end"
-    return "end"
+    question = [m for m in messages if isinstance(m, HumanMessage)][-1].content
+    if sessions.is_follow_up(question, state.get("pinned") or [], state.get("history") or []):
+        log.info("[graph] follow-up covered by pinned session context, no prefetch")
+        return state
+    try:
+        theory = await route(question, state.get("question_vector"))
+    except Exception as exc:
+        log.error(f"[graph] router failed, falling back to the tool loop: {exc}")
+        return state
+    if theory is None:
+        return state
+
+    tc = {"name": THEORY_TOOLS[theory], "args": {"query": question}, "id": "router_prefetch", "type": "tool_call"}
+    messages.append(AIMessage(content="", tool_calls=[tc]))
+    semaphore = asyncio.Semaphore(1)
+    result = await _run_tool_call(tc, {t.name: t for t in TOOLS}, semaphore, _remaining(state))
+    round_stats = _append_tool_results(messages, [tc], [result], _pinned_ids(state))
+    state["messages"] = messages
+    state["theory"] = theory
+    state["stop_reason"] = _budget_stop(state, round_stats)
+    return state
+
+
+def should_continue(state: AgentState) -> str:
+    if state.get("stop_reason"):
+        return "answer"
+    tool_calls = getattr(state["messages"][-1], "tool_calls", None) or []
+    return "tools" if tool_calls else "end"
+
+
+def after_search(state: AgentState) -> str:
+    return "answer" if state.get("stop_reason") else "agent"
+
+
+@traced("node.language")
+async def enforce_language(state: AgentState) -> AgentState:
+    """
+    The final answer must be Russian. A cheap script check decides whether a
+    translation pass is needed at all; only then one more generation runs.
+    """
+    last = state["messages"][-1]
+    if not settings.LANGUAGE_ENFORCE_ENABLED or not isinstance(last, AIMessage) or not isinstance(last.content, str):
+        return state
+    await count_stat(language.STATS_KEY, "checked")
+    if not language.needs_translation(last.content):
+        return state
+    log.info(f"[graph] answer is not in Russian (cyrillic ratio {language.cyrillic_ratio(last.content):.2f}), translating")
+    await count_stat(language.STATS_KEY, "translated")
+    translated = await language.translate(last.content)
+    state["messages"] = state["messages"] + [AIMessage(content=translated)]
+    return state
 
 
 def build_graph() -> Runnable:
     graph = StateGraph(AgentState)
 
+    graph.add_node("route", route_question)
     graph.add_node("agent", call_llm_with_tools)
     graph.add_node("tools", execute_tools)
+    graph.add_node("answer", answer_now)
+    graph.add_node("language", enforce_language)
 
-    graph.set_entry_point("agent")
+    graph.set_entry_point("route")
+    graph.add_conditional_edges("route", after_search, {"agent": "agent", "answer": "answer"})
     graph.add_conditional_edges(
         "agent",
         should_continue,
-        {"tools": "tools", "end": END},
+        {"tools": "tools", "answer": "answer", "end": "language"},
     )
-    graph.add_edge("tools", "agent")
+    graph.add_conditional_edges("tools", after_search, {"agent": "agent", "answer": "answer"})
+    graph.add_edge("answer", "language")
+    graph.add_edge("language", END)
 
     return graph.compile()
 
@@ -126,34 +361,37 @@ def _safe_parse(content: Any) -> Any:
     return content
 
 
-async def run_agent(question: str) -> Dict[str, Any]:
-    cache_key = f"llm_cache:{hashlib.sha1(question.encode('utf-8')).hexdigest()}"
-    redis_client = None
-    try:
-        redis_client = get_redis()
-    except Exception:
-        redis_client = None
-
-    if redis_client:
-        cached = redis_client.get(cache_key)
-        if cached:
-            try:
-                data = json.loads(cached)
-                import logging
-                logging.getLogger(__name__).info(f"[cache] hit for question")
-                return data
-            except Exception:
-                pass
-
-    executor = get_agent_executor()
-    initial_state: AgentState = {
+def _initial_state(
+    question: str,
+    session: Optional[Dict[str, Any]] = None,
+    question_vector: Optional[List[float]] = None,
+) -> AgentState:
+    session = session or sessions.empty_session()
+    return {
         "messages": [HumanMessage(content=question)],
         "theory": None,
         "citations": [],
         "iterations": 0,
         "output": None,
+        "history": sessions.history_messages(session),
+        "pinned": session["pinned"],
+        "question_vector": question_vector,
+        "deadline": time.monotonic() + settings.AGENT_DEADLINE_SECONDS,
+        "stop_reason": None,
+    }
+
+
+def _citation(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "chunk_id": item.get("chunk_id"),
+        "book_id": item.get("book_id"),
+        "theory": item.get("theory"),
+        "pages": [item.get("page_start"), item.get("page_end")],
+        "score": item.get("score"),
     }
-    result_state = await executor.ainvoke(initial_state)
+
+
+def _build_result(result_state: AgentState) -> Dict[str, Any]:
     ai_messages = [m for m in result_state["messages"] if isinstance(m, AIMessage)]
     answer = ai_messages[-1].content if ai_messages else ""
 
@@ -162,18 +400,11 @@ async def run_agent(question: str) -> Dict[str, Any]:
         if isinstance(m, ToolMessage):
             parsed = _safe_parse(m.content)
             if isinstance(parsed, list):
-                for item in parsed:
-                    if isinstance(item, dict):
-                        citations.append(
-                            {
-                                "chunk_id": item.get("chunk_id"),
-                                "book_id": item.get("book_id"),
-                                "theory": item.get("theory"),
-                                "pages": [item.get("page_start"), item.get("page_end")],
-                                "score": item.get("score"),
-                            }
-                        )
+                citations = [_citation(item) for item in parsed if isinstance(item, dict)]
             break
+    else:
+        # Follow-up answered from the session's pinned chunks without a search.
+        citations = [_citation(item) for item in result_state.get("pinned") or []]
 
     return {
         "answer": answer,
@@ -181,18 +412,184 @@ async def run_agent(question: str) -> Dict[str, Any]:
         "theory": result_state.get("theory"),
     }
 
-    result = {
-        "answer": answer,
-        "citations": citations,
-        "theory": result_state.get("theory"),
+
+async def _load_session(
+    session_id: str | None,
+    chat_history: Optional[List[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    if session_id:
+        return await sessions.load(session_id)
+    return sessions.from_chat_history(chat_history)
+
+
+async def _cited_chunks(question: str, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Chunks to pin for an answer that came from the answer cache or another
+    request's run: its citations read back from Qdrant and the chunk store,
+    compacted as a tool result for this question would have been.
+    """
+    try:
+        chunks = await fetch_chunks(result.get("citations") or [])
+    except Exception as exc:
+        log.warning(f"[session] failed to load cited chunks: {exc}")
+        return []
+    return compact_chunks(chunks, question, set())
+
+
+async def _finish_turn(
+    session_id: str | None,
+    session: Dict[str, Any],
+    question: str,
+    result: Dict[str, Any],
+    chunks: Optional[List[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    Saves the turn to the session. `chunks` are the chunks shown to the model
+    in this request, or None when the result was not computed here.
+    """
+    if not session_id:
+        return result
+    if chunks is None:
+        chunks = await _cited_chunks(question, result)
+    await sessions.save_turn(session_id, session, question, result.get("answer", ""), chunks)
+    return dict(result, session_id=session_id)
+
+
+async def run_agent(
+    question: str,
+    session_id: str | None = None,
+    chat_history: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Answers one question. With `session_id` the turn continues (and is saved
+    to) a server-side session; `chat_history` is the stateless alternative.
+    """
+    session = await _load_session(session_id, chat_history)
+    question_vector = None
+    shown: Optional[List[Dict[str, Any]]] = None  # stays None for cached/shared results
+
+    async def compute() -> Dict[str, Any]:
+        nonlocal shown
+        get_llm_scheduler().admit()
+        result_state = await get_agent_executor().ainvoke(_initial_state(question, session, question_vector))
+        shown = shown_chunks(result_state["messages"])
+        result = _build_result(result_state)
+        if not session["turns"]:
+            await answer_cache.store(question, result, question_vector)
+        return result
+
+    if session["turns"]:
+        # The answer depends on the conversation so far: neither cached nor shared.
+        result = await compute()
+    else:
+        cached, question_vector = await answer_cache.lookup(question)
+        # Identical questions in flight share one graph run.
+        result = cached if cached is not None else await single_flight.run_once(question, compute)
+    return await _finish_turn(session_id, session, question, result, shown)
+
+
+def _tool_output_summary(output: Any) -> Dict[str, Any]:
+    if isinstance(output, ToolMessage):
+        output = _safe_parse(output.content)
+    if not isinstance(output, list):
+        return {"chunks": 0}
+    items = [item for item in output if isinstance(item, dict)]
+    return {
+        "chunks": len(items),
+        "books": sorted({item.get("book_id") for item in items if item.get("book_id")}),
     }
 
-    if redis_client:
-        try:
-            redis_client.set(cache_key, json.dumps(result, ensure_ascii=False), ex=CACHE_TTL_SECONDS)
-            import logging
-            logging.getLogger(__name__).info(f"[cache] stored result for question")
-        except Exception:
-            pass
 
-    return result
+async def _run_streamed(state: Dict[str, Any], emit: Callable[[str, Dict[str, Any]], None]) -> Dict[str, Any]:
+    """
+    Runs the graph, passing its progress to `emit` as (event, data); returns
+    the final state.
+    """
+    result_state = None
+    translating = False
+    async for event in get_agent_executor().astream_events(state, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream":
+            if not translating and (event.get("metadata") or {}).get("langgraph_node") == "language":
+                translating = True
+                emit("translation", {})
+            content = getattr(event["data"].get("chunk"), "content", "")
+            if isinstance(content, str) and content:
+                emit("token", {"text": content})
+        elif kind == "on_chat_model_end":
+            output = event["data"].get("output")
+            tool_calls = getattr(output, "tool_calls", None) or []
+            emit("llm_end", {"tool_calls": [tc.get("name") for tc in tool_calls]})
+        elif kind == "on_tool_start":
+            emit("tool_start", {"tool": event["name"], "args": event["data"].get("input")})
+        elif kind == "on_tool_end":
+            emit("tool_end", dict(_tool_output_summary(event["data"].get("output")), tool=event["name"]))
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            result_state = event["data"].get("output")
+
+    if not isinstance(result_state, dict) or "messages" not in result_state:
+        raise RuntimeError("agent run finished without a final state")
+    return result_state
+
+
+async def stream_agent(
+    question: str,
+    session_id: str | None = None,
+    chat_history: Optional[List[Dict[str, Any]]] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Same run as `run_agent`, yielded as (event, data) pairs:
+      tool_start / tool_end   - graph progress (tool name, args, chunks found),
+      token                   - LLM text as it is generated,
+      llm_end                 - an LLM step finished; if it requested tools, the
+                                tokens of that step were a draft, not the answer,
+      translation             - the answer so far was not Russian; the tokens that
+                                follow are its translation and replace it,
+      done                    - final answer, citations and theory.
+    A request that joins a run of the same question (in this process or on
+    another worker) gets the shared answer as one token, like a cache hit.
+    """
+    session = await _load_session(session_id, chat_history)
+    question_vector = None
+    shown: Optional[List[Dict[str, Any]]] = None  # stays None for cached/shared results
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def compute() -> Dict[str, Any]:
+        nonlocal shown
+        result_state = await _run_streamed(
+            _initial_state(question, session, question_vector),
+            lambda event, data: events.put_nowait((event, data)),
+        )
+        shown = shown_chunks(result_state["messages"])
+        result = _build_result(result_state)
+        if not session["turns"]:
+            await answer_cache.store(question, result, question_vector)
+        return result
+
+    if session["turns"]:
+        run = asyncio.ensure_future(compute())
+    else:
+        cached, question_vector = await answer_cache.lookup(question)
+        if cached is not None:
+            yield "token", {"text": cached.get("answer", "")}
+            yield "done", await _finish_turn(session_id, session, question, dict(cached, cached=True), None)
+            return
+        # Identical questions in flight share one graph run, streamed or not.
+        run = asyncio.ensure_future(single_flight.run_once(question, compute))
+    # Queued after the last event of the run, or right away when compute never ran here.
+    run.add_done_callback(lambda _: events.put_nowait(None))
+
+    try:
+        while True:
+            item = await events.get()
+            if item is None:
+                break
+            yield item
+        result = run.result()
+    finally:
+        # A disconnected client stops its own run; a shared run is shielded by run_once.
+        run.cancel()
+
+    if shown is None:
+        yield "token", {"text": result.get("answer", "")}
+    yield "done", await _finish_turn(session_id, session, question, result, shown)
@@ -0,0 +1,68 @@
+import logging
+import re
+from typing import Any, Dict
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.clients.llm_scheduler import PRIORITY_CONTINUATION, get_llm_scheduler
+from app.clients.ollama_client import get_llm
+from app.clients.redis_client import get_async_redis
+from app.config import settings
+from app.utils.tracing import record_llm_usage, span
+
+log = logging.getLogger(__name__)
+
+STATS_KEY = "language:stats"
+
+TRANSLATE_PROMPT = (
+    "Переведи текст на русский, кратко и ясно. Оставь математические обозначения без изменений. "
+    "Ответь только переводом."
+)
+
+# Formulas, inline code and [book_id, pages] references are Latin by nature.
+_IGNORED_RE = re.compile(r"\$[^$]*\$|`[^`]*`|\[[^\]]*\]")
+_CYRILLIC_RE = re.compile(r"[А-Яа-яЁё]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+
+
+def cyrillic_ratio(text: str) -> float | None:
+    """
+    Share of Cyrillic among Cyrillic + Latin letters, or None when the text
+    has too few letters to tell.
+    """
+    text = _IGNORED_RE.sub(" ", text)
+    cyrillic = len(_CYRILLIC_RE.findall(text))
+    latin = len(_LATIN_RE.findall(text))
+    if cyrillic + latin < settings.LANGUAGE_MIN_LETTERS:
+        return None
+    return cyrillic / (cyrillic + latin)
+
+
+def needs_translation(text: str) -> bool:
+    ratio = cyrillic_ratio(text)
+    return ratio is not None and ratio < settings.LANGUAGE_MIN_CYRILLIC_RATIO
+
+
+async def translate(text: str) -> str:
+    """
+    Translation through the chat model used by the graph, so under
+    `astream_events` the translated tokens are streamed like any answer.
+    """
+    try:
+        async with get_llm_scheduler().slot(PRIORITY_CONTINUATION):
+            with span("llm.chat", call="translate") as attrs:
+                result = await get_llm().ainvoke([SystemMessage(content=TRANSLATE_PROMPT), HumanMessage(content=text)])
+                attrs.update(record_llm_usage("translate", result.response_metadata))
+    except Exception as exc:
+        # Includes LLMOverloaded: an untranslated answer beats no answer.
+        log.error(f"[language] failed to translate: {exc}")
+        return text
+    content = result.content if isinstance(result.content, str) else ""
+    return content or text
+
+
+async def get_stats() -> Dict[str, Any]:
+    raw = await get_async_redis().hgetall(STATS_KEY)
+    stats: Dict[str, Any] = {field: int(raw.get(field, 0)) for field in ("checked", "translated")}
+    stats["translated_ratio"] = round(stats["translated"] / stats["checked"], 3) if stats["checked"] else 0.0
+    return stats
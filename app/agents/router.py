@@ -0,0 +1,156 @@
+import json
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.clients.embedding_cache import aembed_cached
+from app.config import settings
+from app.utils.vectors import cosine
+
+log = logging.getLogger(__name__)
+
+# theory -> Qdrant collection of its book
+THEORY_COLLECTIONS = {
+    "linear": settings.QDRANT_COLLECTION_CLS,
+    "discrete": settings.QDRANT_COLLECTION_DS,
+    "nonlinear": settings.QDRANT_COLLECTION_NL,
+}
+
+# theory -> search tool that covers it
+THEORY_TOOLS = {
+    "linear": "search_cls_ogata",
+    "discrete": "search_ds_ogata",
+    "nonlinear": "search_nl_khalil",
+}
+
+# Lowercased substrings (English and Russian stems) that are specific to one book.
+KEYWORDS = {
+    "linear": (
+        "transfer function", "передаточн", "nyquist", "найквист", "bode", "боде", "root locus",
+        "корнев", "laplace", "лаплас", "pid", "пид", "block diagram", "структурн", "steady-state error",
+        "установившейся ошиб", "state space", "state-space", "пространств состояни",
+    ),
+    "discrete": (
+        "z-transform", "z transform", "z-преобраз", "discrete", "дискрет", "sampl", "квантов", "quantiz",
+        "цифров", "digital", "difference equation", "разностн", "zero-order hold", "фиксатор", "a/d", "d/a",
+        "ацп", "цап",
+    ),
+    "nonlinear": (
+        "nonlinear", "нелиней", "lyapunov", "ляпунов", "limit cycle", "предельн цикл", "phase portrait",
+        "фазов", "lipschitz", "липшиц", "bifurcation", "бифуркац", "pendulum", "маятник", "equilibrium",
+        "равновес", "describing function", "гармоническ линеаризац",
+    ),
+}
+
+
+def centroids_path() -> Path:
+    return Path(settings.ROUTER_CENTROIDS_PATH)
+
+
+def compute_centroids(qdrant, collections: Dict[str, str], batch_size: int = 256) -> Dict[str, List[float]]:
+    """
+    Mean of the unit-normalized chunk vectors of every collection, keyed by
+    theory. Scrolls the collections, so it reflects the whole corpus after an
+    incremental ingest too.
+    """
+    centroids: Dict[str, List[float]] = {}
+    for theory, collection in collections.items():
+        total: List[float] | None = None
+        count = 0
+        offset = None
+        while True:
+            points, offset = qdrant.scroll(
+                collection_name=collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=True,
+            )
+            for point in points:
+                vector = point.vector
+                if not isinstance(vector, list) or not vector:
+                    continue
+                norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+                if total is None:
+                    total = [0.0] * len(vector)
+                for i, x in enumerate(vector):
+                    total[i] += x / norm
+                count += 1
+            if offset is None:
+                break
+        if total is not None:
+            centroids[theory] = [x / count for x in total]
+    return centroids
+
+
+def save_centroids(centroids: Dict[str, List[float]]) -> None:
+    path = centroids_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(centroids, f)
+    os.replace(tmp, path)
+
+
+_centroids: Tuple[float, Dict[str, List[float]]] | None = None
+
+
+def load_centroids() -> Dict[str, List[float]]:
+    """
+    Loaded once per process and reloaded when ingest rewrites the file.
+    """
+    global _centroids
+    path = centroids_path()
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return {}
+    if _centroids is None or _centroids[0] != mtime:
+        with path.open("r", encoding="utf-8") as f:
+            _centroids = (mtime, json.load(f))
+    return _centroids[1]
+
+
+def keyword_theory(question: str) -> Optional[str]:
+    text = question.lower()
+    hits = {theory: sum(1 for kw in words if kw in text) for theory, words in KEYWORDS.items()}
+    ranked = sorted(hits.items(), key=lambda item: item[1], reverse=True)
+    if ranked[0][1] == 0 or ranked[0][1] == ranked[1][1]:
+        return None
+    return ranked[0][0]
+
+
+def centroid_theory(vector: List[float]) -> Tuple[Optional[str], float]:
+    """
+    Closest book centroid and its margin over the runner-up.
+    """
+    centroids = load_centroids()
+    if len(centroids) < 2:
+        return None, 0.0
+    scores = sorted(((cosine(vector, c), theory) for theory, c in centroids.items()), reverse=True)
+    return scores[0][1], scores[0][0] - scores[1][0]
+
+
+async def route(question: str, vector: List[float] | None = None) -> Optional[str]:
+    """
+    Theory of the question, or None when the router is not confident and the
+    LLM should pick the tool itself. Centroids are trusted when the margin
+    reaches ROUTER_MIN_MARGIN; keywords decide otherwise, and a disagreement
+    between the two is treated as low confidence. `vector` is the question
+    embedding when the caller already has one (the answer cache lookup).
+    """
+    if vector is None:
+        vector = (await aembed_cached([question]))[0]
+    by_centroid, margin = centroid_theory(vector)
+    by_keyword = keyword_theory(question)
+
+    if by_centroid and by_keyword and by_centroid != by_keyword:
+        theory = None
+    elif by_centroid and margin >= settings.ROUTER_MIN_MARGIN:
+        theory = by_centroid
+    else:
+        theory = by_keyword
+    log.info(f"[router] centroid={by_centroid} margin={margin:.3f} keyword={by_keyword} -> {theory}")
+    return theory
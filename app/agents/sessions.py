@@ -0,0 +1,188 @@
+import json
+import logging
+import re
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from app.agents.context import CHUNK_FIELDS, query_terms
+from app.clients.redis_client import get_async_redis
+from app.config import settings
+from app.utils.tokens import estimate_tokens
+
+log = logging.getLogger(__name__)
+
+# Words that point back at the conversation ("а подробнее?", "why is that?").
+_REFERENCE_RE = re.compile(
+    r"\b(это\w*|эт[аио]\w*|его|е[её]|их|там|тут|подробн\w*|пример\w*|почему|зачем|ещ[её]|дальше"
+    r"|it|its|this|that|these|those|more|example|why)\b",
+    re.IGNORECASE,
+)
+_SHORT_QUESTION_WORDS = 6
+
+PINNED_HEADER = (
+    "\n\nSearch results retrieved in earlier turns of this conversation "
+    "(cite them as [book_id, pages] like any other search result):\n"
+)
+
+
+def _key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+def empty_session() -> Dict[str, Any]:
+    return {"turns": [], "pinned": []}
+
+
+def from_chat_history(chat_history: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Session built from a client-side history ([{"role": "user"|"assistant",
+    "content": ...}, ...]): earlier turns only, no pinned chunks.
+    """
+    session = empty_session()
+    question = None
+    for item in chat_history or []:
+        role, content = item.get("role"), item.get("content")
+        if not isinstance(content, str):
+            continue
+        if role in ("user", "human"):
+            question = content
+        elif role in ("assistant", "ai") and question is not None:
+            session["turns"].append({"question": question, "answer": content})
+            question = None
+    session["turns"] = session["turns"][-settings.SESSION_MAX_TURNS :]
+    return session
+
+
+async def _write(session_id: str, state: Dict[str, Any]) -> None:
+    await get_async_redis().set(
+        _key(session_id),
+        json.dumps(state, ensure_ascii=False),
+        ex=settings.SESSION_TTL_SECONDS,
+    )
+
+
+async def create() -> str:
+    """
+    New empty session, stored right away so that it can be read back.
+    """
+    session_id = uuid.uuid4().hex
+    await _write(session_id, empty_session())
+    return session_id
+
+
+async def get(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Session state from Redis, or None for an unknown or expired session.
+    """
+    raw = await get_async_redis().get(_key(session_id))
+    if not raw:
+        return None
+    return dict(empty_session(), **json.loads(raw))
+
+
+async def load(session_id: str) -> Dict[str, Any]:
+    """
+    Session state for a turn; unknown, expired or unreadable sessions start empty.
+    """
+    try:
+        session = await get(session_id)
+    except Exception as exc:
+        log.warning(f"[session] failed to load {session_id}: {exc}")
+        return empty_session()
+    return session or empty_session()
+
+
+def _fits(chunks: List[Dict]) -> bool:
+    return (
+        len(chunks) <= settings.SESSION_MAX_PINNED_CHUNKS
+        and sum(estimate_tokens(chunk["text"]) for chunk in chunks) <= settings.SESSION_PINNED_MAX_TOKENS
+    )
+
+
+def pin(pinned: List[Dict], chunks: List[Dict]) -> List[Dict]:
+    """
+    Appends newly shown chunks after the already pinned ones, so the pinned
+    block only grows at its end and the prompt prefix before it stays the same
+    between turns. When they do not fit in SESSION_MAX_PINNED_CHUNKS /
+    SESSION_PINNED_MAX_TOKENS, the block starts over with this turn's chunks
+    only (as many as fit): the prefix changes on that turn and is stable again
+    from the next one, instead of shifting on every turn once the cap is reached.
+    """
+    turn: Dict[str, Dict] = {}
+    for chunk in chunks:
+        if chunk.get("chunk_id") and chunk.get("text") and chunk["chunk_id"] not in turn:
+            item = {field: chunk.get(field) for field in CHUNK_FIELDS if field != "score"}
+            item["text"] = chunk["text"]
+            turn[chunk["chunk_id"]] = item
+    known = {chunk["chunk_id"] for chunk in pinned}
+    appended = list(pinned) + [item for chunk_id, item in turn.items() if chunk_id not in known]
+    if _fits(appended):
+        return appended
+    fresh: List[Dict] = []
+    for item in turn.values():
+        if not _fits(fresh + [item]):
+            break
+        fresh.append(item)
+    return fresh
+
+
+async def save_turn(
+    session_id: str,
+    session: Dict[str, Any],
+    question: str,
+    answer: str,
+    chunks: List[Dict],
+) -> None:
+    """
+    Records the finished turn. Concurrent turns of one session are not
+    serialized: the last one to finish wins.
+    """
+    state = {
+        "turns": (session["turns"] + [{"question": question, "answer": answer}])[-settings.SESSION_MAX_TURNS :],
+        "pinned": pin(session["pinned"], chunks),
+    }
+    try:
+        await _write(session_id, state)
+    except Exception as exc:
+        log.warning(f"[session] failed to save {session_id}: {exc}")
+
+
+async def delete(session_id: str) -> bool:
+    return bool(await get_async_redis().delete(_key(session_id)))
+
+
+def history_messages(session: Dict[str, Any]) -> List[BaseMessage]:
+    messages: List[BaseMessage] = []
+    for turn in session["turns"]:
+        messages += [HumanMessage(content=turn["question"]), AIMessage(content=turn["answer"])]
+    return messages
+
+
+def context_block(pinned: List[Dict]) -> str:
+    """
+    Suffix of the system message with the pinned chunks; empty without them.
+    """
+    if not pinned:
+        return ""
+    return PINNED_HEADER + json.dumps(pinned, ensure_ascii=False)
+
+
+def is_follow_up(question: str, pinned: List[Dict], history: List[BaseMessage]) -> bool:
+    """
+    True when the question can likely be answered from what the session
+    already has: a short question referring back to it ("а подробнее?"), or
+    most of its terms occur in the pinned chunks or earlier turns.
+    """
+    if not pinned:
+        return False
+    if len(question.split()) <= _SHORT_QUESTION_WORDS and _REFERENCE_RE.search(question):
+        return True
+    terms = query_terms(question)
+    if not terms:
+        return True
+    known = set()
+    for text in [chunk.get("text") or "" for chunk in pinned] + [str(m.content) for m in history]:
+        known |= query_terms(text)
+    return len(terms & known) / len(terms) >= settings.SESSION_FOLLOWUP_MIN_OVERLAP
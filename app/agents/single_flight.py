@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.agents.answer_cache import question_hash
+from app.clients.redis_client import count_stat, get_async_redis
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+STATS_KEY = "single_flight:stats"
+
+# normalized question hash -> the one running computation in this process
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def _keys(qhash: str) -> tuple[str, str, str]:
+    return f"single_flight:lock:{qhash}", f"single_flight:result:{qhash}", f"single_flight:{qhash}"
+
+
+async def _wait_for_leader(qhash: str) -> Optional[Dict[str, Any]]:
+    """
+    Result published by the worker holding the lock, or None when the leader
+    failed, went away or did not finish within SINGLE_FLIGHT_WAIT_SECONDS.
+    """
+    redis_client = get_async_redis()
+    lock_key, result_key, channel = _keys(qhash)
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT_SECONDS
+    pubsub = redis_client.pubsub()
+    try:
+        await pubsub.subscribe(channel)
+        # Subscribed first, then checked: a result published in between is not lost.
+        while time.monotonic() < deadline:
+            published = await redis_client.get(result_key)
+            if published:
+                return json.loads(published)
+            if not await redis_client.exists(lock_key):
+                return None
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is not None:
+                return json.loads(message["data"]) if message["data"] else None
+        return None
+    finally:
+        await pubsub.unsubscribe(channel)
+        await pubsub.aclose()
+
+
+async def _run_distributed(qhash: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    redis_client = get_async_redis()
+    lock_key, result_key, channel = _keys(qhash)
+    try:
+        leader = await redis_client.set(lock_key, "1", nx=True, ex=settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS)
+    except Exception as exc:
+        log.warning(f"[single_flight] redis lock failed, computing locally: {exc}")
+        return await compute()
+
+    if not leader:
+        try:
+            result = await _wait_for_leader(qhash)
+        except Exception as exc:
+            log.warning(f"[single_flight] waiting for the leader failed: {exc}")
+            result = None
+        if result is not None:
+            await count_stat(STATS_KEY, "joined_remote")
+            log.info("[single_flight] reused the result of another worker")
+            return result
+        return await compute()
+
+    await count_stat(STATS_KEY, "leader")
+    payload = ""
+    try:
+        result = await compute()
+        payload = json.dumps(result, ensure_ascii=False, default=str)
+        await redis_client.set(result_key, payload, ex=settings.SINGLE_FLIGHT_RESULT_TTL_SECONDS)
+        return result
+    finally:
+        # An empty message tells the followers to compute on their own.
+        try:
+            await redis_client.publish(channel, payload)
+            await redis_client.delete(lock_key)
+        except Exception as exc:
+            log.warning(f"[single_flight] failed to release {lock_key}: {exc}")
+
+
+def _retrieve(task: asyncio.Task) -> None:
+    # Nobody may be left awaiting a failed run; keep asyncio from warning about it.
+    if not task.cancelled():
+        task.exception()
+
+
+def local_inflight(question: str) -> Optional[asyncio.Task]:
+    return _inflight.get(question_hash(question))
+
+
+async def run_once(question: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Concurrent identical questions (same normalized text) share one
+    computation: within the process through a shared task, across workers
+    through a Redis lock plus a pub/sub message with the result. The shared
+    task is shielded, so a disconnecting client does not cancel it for the
+    others.
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await compute()
+    qhash = question_hash(question)
+    task = _inflight.get(qhash)
+    if task is None:
+        task = asyncio.create_task(_run_distributed(qhash, compute))
+        _inflight[qhash] = task
+        task.add_done_callback(lambda t: _inflight.pop(qhash, None))
+        task.add_done_callback(_retrieve)
+    else:
+        await count_stat(STATS_KEY, "joined_local")
+        log.info("[single_flight] joined an in-flight run of the same question")
+    return await asyncio.shield(task)
+
+
+async def get_stats() -> Dict[str, int]:
+    raw = await get_async_redis().hgetall(STATS_KEY)
+    return {field: int(raw.get(field, 0)) for field in ("leader", "joined_local", "joined_remote")}
@@ -1,4 +1,4 @@
-from typing import Any, List, TypedDict
+from typing import Any, Dict, List, TypedDict
 
 from langchain_core.messages import BaseMessage
 
@@ -9,3 +9,14 @@ class AgentState(TypedDict):
     citations: list[dict]
     iterations: int
     output: Any | None
+    # Conversation so far: earlier turns (replayed before this question) and
+    # chunks pinned into the system message.
+    history: List[BaseMessage]
+    pinned: List[Dict]
+    # Embedding of the question from the answer cache lookup (None when the
+    # lookup did not embed it); reused by the router.
+    question_vector: List[float] | None
+    # Loop budget: time.monotonic() deadline of the run, and why the tool loop
+    # was stopped early (None while the model decides).
+    deadline: float
+    stop_reason: str | None
@@ -1,115 +1,282 @@
-from typing import Dict, List
-import json
+import asyncio
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
 import logging
 
-import httpx
 from langchain_core.tools import tool
 
-from app.clients.qdrant_client import get_qdrant
-from app.clients.redis_client import get_redis
-from app.clients.ollama_client import get_embedding_model
+from app.agents.router import THEORY_COLLECTIONS
+from app.clients.http_client import get_http_client
+from app.clients.qdrant_client import qdrant_headers, qdrant_url
+from app.clients.qdrant_profiles import search_params
+from app.clients.embedding_cache import aembed_cached
 from app.config import settings
+from app.retrieval.bm25 import get_bm25_index
+from app.retrieval.fusion import reciprocal_rank_fusion
+from app.retrieval.rerank import rerank
+from app.storage.chunk_store import get_chunk_store
+from app.utils.tokens import tokenize
+from app.utils.tracing import span, traced
+from app.utils.vectors import cosine
 
 log = logging.getLogger(__name__)
 
+# (collection, query, k) -> ranked chunks searched ahead of time (batch runs).
+_prefetched: ContextVar[Dict[Tuple[str, str, int], List[Dict]] | None] = ContextVar(
+    "prefetched_searches", default=None
+)
 
-def _search_collection(collection: str, query: str, k: int = 5) -> List[Dict]:
-    _ = get_qdrant()  # keep client around in case of future use/reuse
-    embedder = get_embedding_model()
-    redis_client = get_redis()
-
-    vector = embedder.embed_query(query)
-    log.info(f"[search] collection={collection} q='{query}' k={k}")
-
-    base = settings.QDRANT_URL.rstrip("/")
-    url = f"{base}/collections/{collection}/points/search"
-    payload = {"vector": vector, "limit": k}
-
-    try:
-        resp = httpx.post(url, json=payload, timeout=600.0)  # allow up to 10 minutes
-        resp.raise_for_status()
-        data = resp.json()
-        search_result = data.get("result") or []
-    except Exception as exc:
-        log.error(f"[search] REST search failed for {collection}: {exc}")
-        raise
 
+async def _points_to_chunks(points: List[Dict]) -> List[Dict]:
+    with span("chunk_load", backend=settings.CHUNK_STORE_BACKEND, points=len(points)):
+        texts = await get_chunk_store().load(points)
     chunks = []
-    for point in search_result:
-        pid = str(point.get("id"))
+    for point, text in zip(points, texts):
         meta = point.get("payload") or {}
-        score = point.get("score")
-
-        redis_meta = redis_client.hgetall(f"chunk:{pid}")
-        path = redis_meta.get("path")
-        text = ""
-        if path:
-            try:
-                with open(path, "r", encoding="utf-8") as f:
-                    text = f.read()
-            except FileNotFoundError:
-                text = ""
-
         chunks.append(
             {
-                "chunk_id": pid,
+                "chunk_id": str(point.get("id")),
                 "text": text,
-                "score": score,
+                "score": point.get("score"),
                 "book_id": meta.get("book_id"),
                 "theory": meta.get("theory"),
                 "page_start": meta.get("page_start"),
                 "page_end": meta.get("page_end"),
             }
         )
-    log.info(f"[search] found {len(chunks)} chunks in {collection}")
     return chunks
 
 
-@tool("translate_to_russian", return_direct=True)
-def translate_to_russian(text: str) -> str:
-    """
-    Переводит произвольный текст на русский язык, сохраняя смысл и математические обозначения.
-    """
-    base = settings.OLLAMA_BASE_URL.rstrip("/")
-    url = f"{base}/api/chat"
-    payload = {
-        "model": settings.OLLAMA_MODEL_NAME,
-        "messages": [
-            {"role": "system", "content": "Переведи текст на русский, кратко и ясно. Оставь математические обозначения без изменений. Ответь только переводом."},
-            {"role": "user", "content": text},
-        ],
-        "stream": False,
-    }
+@traced("qdrant.search")
+async def _search_vector(collection: str, vector: List[float], k: int = 5) -> List[Dict]:
+    url = qdrant_url(f"collections/{collection}/points/search")
+    payload = {"vector": vector, "limit": k, "with_payload": True, "params": search_params()}
+
     try:
-        resp = httpx.post(url, json=payload, timeout=120.0)
+        resp = await get_http_client().post(url, json=payload, headers=qdrant_headers())
         resp.raise_for_status()
         data = resp.json()
-        message = data.get("message", {}) if isinstance(data, dict) else {}
-        content = message.get("content") or ""
-        if not content and isinstance(data, dict):
-            content = data.get("response") or ""
-        return content or text
+        search_result = data.get("result") or []
     except Exception as exc:
-        log.error(f"[translate] failed to translate: {exc}")
-        return text
+        log.error(f"[search] REST search failed for {collection}: {exc}")
+        raise
+
+    chunks = await _points_to_chunks(search_result)
+    log.info(f"[search] found {len(chunks)} chunks in {collection}")
+    return chunks
+
+
+@traced("qdrant.search_batch")
+async def _search_vector_batch(collection: str, vectors: List[List[float]], k: int = 5) -> List[List[Dict]]:
+    url = qdrant_url(f"collections/{collection}/points/search/batch")
+    params = search_params()
+    payload = {"searches": [{"vector": vector, "limit": k, "with_payload": True, "params": params} for vector in vectors]}
+    resp = await get_http_client().post(url, json=payload, headers=qdrant_headers())
+    resp.raise_for_status()
+    results = resp.json().get("result") or []
+    return list(await asyncio.gather(*(_points_to_chunks(points) for points in results)))
+
+
+def _lexical_query(query: str) -> bool:
+    """
+    The BM25 indexes hold English book text: a query that is mostly not
+    Latin-script (the router prefetch searches with the user's question,
+    usually Russian) would only match its few Latin terms.
+    """
+    terms = tokenize(query)
+    latin = sum(1 for term in terms if term.isascii() and term.isalpha())
+    return bool(terms) and latin * 2 >= len(terms)
+
+
+@traced("bm25.search")
+async def _search_sparse(collection: str, query: str, vector: List[float], k: int = 5) -> List[Dict]:
+    """
+    BM25 over the local index, then one Qdrant fetch for payloads/vectors so
+    lexical-only hits get a cosine score comparable to dense hits.
+    """
+    hits = (await get_bm25_index(collection)).search(query, k)
+    if not hits:
+        return []
+    resp = await get_http_client().post(
+        qdrant_url(f"collections/{collection}/points"),
+        json={"ids": [chunk_id for chunk_id, _ in hits], "with_payload": True, "with_vector": True},
+        headers=qdrant_headers(),
+    )
+    resp.raise_for_status()
+    by_id = {str(p.get("id")): p for p in resp.json().get("result") or []}
+
+    points = []
+    bm25_scores = []
+    for chunk_id, bm25_score in hits:
+        point = by_id.get(chunk_id)
+        if point is None:
+            continue
+        point_vector = point.get("vector")
+        point["score"] = cosine(vector, point_vector) if isinstance(point_vector, list) else None
+        points.append(point)
+        bm25_scores.append(bm25_score)
+    chunks = await _points_to_chunks(points)
+    for chunk, bm25_score in zip(chunks, bm25_scores):
+        chunk["bm25_score"] = round(bm25_score, 4)
+    return chunks
+
+
+async def _search_hybrid(
+    collection: str,
+    query: str,
+    vector: List[float],
+    k: int = 5,
+    dense: List[Dict] | None = None,
+) -> List[Dict]:
+    """
+    Dense and BM25 candidates fetched concurrently and fused with RRF.
+    `dense` skips the vector search when its hits are already known.
+    Non-English queries are searched dense-only.
+    """
+    dense_search = _search_vector(collection, vector, k) if dense is None else asyncio.sleep(0, dense)
+    if not settings.HYBRID_SEARCH_ENABLED or not _lexical_query(query):
+        return await dense_search
+    dense, sparse = await asyncio.gather(
+        dense_search,
+        _search_sparse(collection, query, vector, k),
+        return_exceptions=True,
+    )
+    if isinstance(dense, Exception):
+        raise dense
+    if isinstance(sparse, Exception):
+        log.error(f"[search] BM25 search failed for {collection}: {sparse}")
+        return dense
+    if not sparse:
+        return dense
+    return reciprocal_rank_fusion([dense, sparse], k)
+
+
+async def fetch_chunks(refs: List[Dict]) -> List[Dict]:
+    """
+    Chunks by id, in the order of `refs` (citations: chunk_id + theory), with
+    text from the chunk store. Used when an answer was not computed in this
+    request and its chunks must be read back.
+    """
+    by_collection: Dict[str, List[str]] = {}
+    for ref in refs:
+        collection = THEORY_COLLECTIONS.get(ref.get("theory"))
+        if collection and ref.get("chunk_id"):
+            by_collection.setdefault(collection, []).append(ref["chunk_id"])
+
+    async def fetch(collection: str, ids: List[str]) -> List[Dict]:
+        resp = await get_http_client().post(
+            qdrant_url(f"collections/{collection}/points"),
+            json={"ids": ids, "with_payload": True},
+            headers=qdrant_headers(),
+        )
+        resp.raise_for_status()
+        return await _points_to_chunks(resp.json().get("result") or [])
+
+    results = await asyncio.gather(*(fetch(c, ids) for c, ids in by_collection.items()))
+    by_id = {chunk["chunk_id"]: chunk for chunks in results for chunk in chunks}
+    return [by_id[ref["chunk_id"]] for ref in refs if ref.get("chunk_id") in by_id]
+
+
+def _fetch_k(k: int) -> int:
+    return max(k, settings.RERANK_FETCH_K) if settings.RERANK_ENABLED else k
+
+
+async def _search_collection(collection: str, query: str, k: int = 5) -> List[Dict]:
+    prefetched = _prefetched.get()
+    if prefetched is not None and (collection, query, k) in prefetched:
+        log.info(f"[search] collection={collection} q='{query}' k={k} (prefetched)")
+        return prefetched[(collection, query, k)]
+    vector = (await aembed_cached([query]))[0]
+    log.info(f"[search] collection={collection} q='{query}' k={k}")
+    chunks = await _search_hybrid(collection, query, vector, _fetch_k(k))
+    if settings.RERANK_ENABLED:
+        chunks = await rerank(query, chunks, k)
+    return chunks
+
+
+async def prefetch_collection_searches(requests: List[Tuple[str, str]], k: int = 5) -> None:
+    """
+    Runs what `_search_collection` would run for every (collection, query)
+    with one embedding request for all queries and one Qdrant batch search
+    per collection, and makes the results visible to `_search_collection`
+    in the current context (and the tasks it starts afterwards).
+    """
+    requests = list(dict.fromkeys(requests))
+    queries = list(dict.fromkeys(query for _, query in requests))
+    if not queries:
+        return
+    vectors = dict(zip(queries, await aembed_cached(queries)))
+    by_collection: Dict[str, List[str]] = {}
+    for collection, query in requests:
+        by_collection.setdefault(collection, []).append(query)
+
+    fetch_k = _fetch_k(k)
+    results: Dict[Tuple[str, str, int], List[Dict]] = dict(_prefetched.get() or {})
+
+    async def finish(collection: str, query: str, dense: List[Dict]) -> None:
+        chunks = await _search_hybrid(collection, query, vectors[query], fetch_k, dense=dense)
+        if settings.RERANK_ENABLED:
+            chunks = await rerank(query, chunks, k)
+        results[(collection, query, k)] = chunks
+
+    for collection, collection_queries in by_collection.items():
+        try:
+            dense_lists = await _search_vector_batch(collection, [vectors[q] for q in collection_queries], fetch_k)
+            await asyncio.gather(*(finish(collection, q, d) for q, d in zip(collection_queries, dense_lists)))
+        except Exception as exc:
+            # The graph runs search on their own for whatever is missing.
+            log.error(f"[search] batch prefetch failed for {collection}: {exc}")
+    _prefetched.set(results)
+
+
+async def _search_all_collections(query: str, k: int = 5) -> List[Dict]:
+    """
+    Embed once, search every book concurrently and fuse the rankings (RRF).
+    """
+    collections = list(THEORY_COLLECTIONS.values())
+    vector = (await aembed_cached([query]))[0]
+    log.info(f"[search] all collections q='{query}' k={k}")
+    fetch_k = _fetch_k(k)
+    results = await asyncio.gather(
+        *(_search_hybrid(c, query, vector, fetch_k) for c in collections),
+        return_exceptions=True,
+    )
+    ranked_lists = []
+    for collection, result in zip(collections, results):
+        if isinstance(result, Exception):
+            log.error(f"[search] {collection} skipped in fused search: {result}")
+            continue
+        ranked_lists.append(result)
+    if not ranked_lists:
+        raise RuntimeError("search failed in every collection")
+    fused = reciprocal_rank_fusion(ranked_lists, fetch_k)
+    if settings.RERANK_ENABLED:
+        return await rerank(query, fused, k)
+    return fused[:k]
 
 
 @tool("search_cls_ogata", return_direct=False)
-def search_cls_ogata(query: str) -> List[Dict]:
+async def search_cls_ogata(query: str) -> List[Dict]:
     """Поиск по книге Katsuhiko Ogata (классические линейные системы управления)."""
-    return _search_collection(settings.QDRANT_COLLECTION_CLS, query)
+    return await _search_collection(settings.QDRANT_COLLECTION_CLS, query)
 
 
 @tool("search_ds_ogata", return_direct=False)
-def search_ds_ogata(query: str) -> List[Dict]:
+async def search_ds_ogata(query: str) -> List[Dict]:
     """Поиск по книге Ogata 'Discrete-Time Control Systems'."""
-    return _search_collection(settings.QDRANT_COLLECTION_DS, query)
+    return await _search_collection(settings.QDRANT_COLLECTION_DS, query)
 
 
 @tool("search_nl_khalil", return_direct=False)
-def search_nl_khalil(query: str) -> List[Dict]:
+async def search_nl_khalil(query: str) -> List[Dict]:
     """Поиск по книге Khalil 'Nonlinear Systems'."""
-    return _search_collection(settings.QDRANT_COLLECTION_NL, query)
+    return await _search_collection(settings.QDRANT_COLLECTION_NL, query)
+
+
+@tool("search_all", return_direct=False)
+async def search_all(query: str) -> List[Dict]:
+    """Поиск сразу по всем трём книгам (Ogata CLS, Ogata DS, Khalil NL) с общим ранжированием; у каждого фрагмента указан book_id."""
+    return await _search_all_collections(query)
 
 
-TOOLS = [search_cls_ogata, search_ds_ogata, search_nl_khalil, translate_to_russian]
+TOOLS = [search_cls_ogata, search_ds_ogata, search_nl_khalil, search_all]
@@ -0,0 +1,99 @@
+import hashlib
+import logging
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.clients.ollama_client import aembed
+from app.clients.redis_client import get_async_redis_bytes
+from app.config import settings
+from app.utils.tracing import span
+
+log = logging.getLogger(__name__)
+
+# float32 arrays: ~4 bytes per dimension instead of ~32 for a list of floats.
+_lru: "OrderedDict[str, array]" = OrderedDict()
+
+
+def _key(text: str) -> str:
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return f"emb:{settings.OLLAMA_EMBED_MODEL_NAME}:{digest}"
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(raw: bytes) -> List[float]:
+    vec = array("f")
+    vec.frombytes(raw)
+    return vec.tolist()
+
+
+def _lru_get(key: str) -> Optional[List[float]]:
+    vector = _lru.get(key)
+    if vector is None:
+        return None
+    _lru.move_to_end(key)
+    return vector.tolist()
+
+
+def _lru_put(key: str, vector: List[float]) -> None:
+    _lru[key] = array("f", vector)
+    _lru.move_to_end(key)
+    while len(_lru) > settings.EMBED_CACHE_LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+def _ttl() -> Optional[int]:
+    return settings.EMBED_CACHE_TTL_SECONDS or None
+
+
+def _from_lru(keys: List[str]) -> Dict[int, List[float]]:
+    found = {}
+    for i, key in enumerate(keys):
+        vector = _lru_get(key)
+        if vector is not None:
+            found[i] = vector
+    return found
+
+
+async def aembed_cached(texts: List[str]) -> List[List[float]]:
+    """
+    Content-addressed embeddings: LRU -> Redis MGET -> Ollama for the rest.
+    """
+    if not settings.EMBED_CACHE_ENABLED:
+        return await aembed(texts)
+
+    keys = [_key(t) for t in texts]
+    found = _from_lru(keys)
+    missing = [i for i in range(len(texts)) if i not in found]
+
+    redis_client = get_async_redis_bytes()
+    if missing:
+        try:
+            with span("redis.embed_cache", keys=len(missing)):
+                raws = await redis_client.mget([keys[i] for i in missing])
+            for i, raw in zip(missing, raws):
+                if raw:
+                    found[i] = _unpack(raw)
+                    _lru_put(keys[i], found[i])
+        except Exception as exc:
+            log.warning(f"[embed-cache] redis lookup failed: {exc}")
+        missing = [i for i in missing if i not in found]
+
+    if missing:
+        vectors = await aembed([texts[i] for i in missing])
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for i, vector in zip(missing, vectors):
+                    pipe.set(keys[i], _pack(vector), ex=_ttl())
+                await pipe.execute()
+        except Exception as exc:
+            log.warning(f"[embed-cache] redis store failed: {exc}")
+        for i, vector in zip(missing, vectors):
+            found[i] = vector
+            _lru_put(keys[i], vector)
+
+    return [found[i] for i in range(len(texts))]
+
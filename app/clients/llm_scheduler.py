@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from prometheus_client import Gauge
+
+from app.config import settings
+from app.utils.tracing import STAGE_SECONDS
+
+log = logging.getLogger(__name__)
+
+# Lower value is served first: steps of runs that already started go ahead
+# of new runs so admitted requests finish instead of all slowing down together.
+PRIORITY_CONTINUATION = 0
+PRIORITY_NEW = 1
+
+
+class LLMOverloaded(Exception):
+    """
+    The LLM queue cannot take (status 429) or did not serve in time (503) a request.
+    """
+
+    def __init__(self, detail: str, status_code: int, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """
+    Bounded concurrency in front of the chat model: at most `slots` calls
+    run at once (Ollama's OLLAMA_NUM_PARALLEL per worker), the rest wait in a
+    priority queue (FIFO within a priority) for at most `max_wait` seconds.
+    """
+
+    def __init__(self, slots: int, max_queue: int, max_wait: float):
+        self.slots = max(1, slots)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._active = 0
+        self._queued = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._call_seconds = 10.0  # EMA of one LLM call, for Retry-After
+        self.counters: Dict[str, int] = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_wait_timeout": 0,
+            "completed": 0,
+        }
+        self._wait_total = 0.0
+
+    def retry_after(self) -> int:
+        rounds = (self._queued + self._active) / self.slots
+        return max(1, math.ceil(rounds * self._call_seconds))
+
+    def admit(self) -> None:
+        """
+        Fast rejection of a new run while the queue is already full.
+        """
+        if self._queued >= self.max_queue:
+            self.counters["rejected_queue_full"] += 1
+            raise LLMOverloaded("LLM queue is full", 429, self.retry_after())
+
+    async def _acquire(self, priority: int) -> None:
+        if self._active < self.slots and not self._queued:
+            self._active += 1
+            STAGE_SECONDS.labels("llm.queue_wait", "ok").observe(0.0)
+            return
+        if priority != PRIORITY_CONTINUATION:
+            self.admit()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._queued += 1
+        started = time.monotonic()
+        status = "error"
+        try:
+            await asyncio.wait_for(fut, timeout=self.max_wait)
+            status = "ok"
+        except asyncio.TimeoutError:
+            self.counters["rejected_wait_timeout"] += 1
+            raise LLMOverloaded(
+                f"LLM queue wait exceeded {self.max_wait:.0f}s", 503, self.retry_after()
+            ) from None
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just before the cancellation.
+                self._release()
+            raise
+        finally:
+            self._queued -= 1
+            waited = time.monotonic() - started
+            self._wait_total += waited
+            STAGE_SECONDS.labels("llm.queue_wait", status).observe(waited)
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)  # slot goes straight to the waiter
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NEW) -> AsyncIterator[None]:
+        await self._acquire(priority)
+        self.counters["admitted"] += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._call_seconds = 0.8 * self._call_seconds + 0.2 * (time.monotonic() - started)
+            self.counters["completed"] += 1
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        admitted = self.counters["admitted"]
+        return dict(
+            self.counters,
+            slots=self.slots,
+            active=self._active,
+            queued=self._queued,
+            max_queue=self.max_queue,
+            max_wait_seconds=self.max_wait,
+            avg_wait_ms=round(self._wait_total / admitted * 1000, 1) if admitted else 0.0,
+            avg_call_seconds=round(self._call_seconds, 2),
+            retry_after=self.retry_after(),
+        )
+
+
+_scheduler: LLMScheduler | None = None
+
+LLM_ACTIVE = Gauge("agent_llm_active_calls", "LLM calls holding a scheduler slot in this worker.")
+LLM_QUEUED = Gauge("agent_llm_queued_calls", "LLM calls waiting for a scheduler slot in this worker.")
+LLM_ACTIVE.set_function(lambda: _scheduler._active if _scheduler else 0)
+LLM_QUEUED.set_function(lambda: _scheduler._queued if _scheduler else 0)
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(
+            settings.LLM_MAX_CONCURRENCY,
+            settings.LLM_MAX_QUEUE,
+            settings.LLM_MAX_QUEUE_WAIT_SECONDS,
+        )
+    return _scheduler
@@ -1,18 +1,101 @@
+import asyncio
+import logging
+import time
+from typing import List
+
+import httpx
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 
+from app.clients.http_client import get_http_client
 from app.config import settings
+from app.utils.tracing import traced
+
+log = logging.getLogger(__name__)
 
+_llm: ChatOllama | None = None
 
-def get_llm():
+
+def build_llm() -> ChatOllama:
     return ChatOllama(
         base_url=settings.OLLAMA_BASE_URL,
         model=settings.OLLAMA_MODEL_NAME,
         temperature=0.2,
+        keep_alive=settings.OLLAMA_KEEP_ALIVE,
+        client_kwargs={
+            "timeout": httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+            "limits": httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        },
     )
 
 
+def get_llm() -> ChatOllama:
+    """
+    Process-wide chat model: one Ollama client (and connection pool) shared by
+    every request instead of a new one per graph step.
+    """
+    global _llm
+    if _llm is None:
+        _llm = build_llm()
+    return _llm
+
+
+async def close_llm() -> None:
+    global _llm
+    if _llm is not None:
+        await _llm._async_client.close()
+        _llm._client.close()
+        _llm = None
+
+
+async def warm_up() -> None:
+    """
+    Load the chat and embedding models into Ollama (kept for OLLAMA_KEEP_ALIVE)
+    before the first user request pays for it. Failures are logged only.
+    """
+    base = settings.OLLAMA_BASE_URL.rstrip("/")
+    client = get_http_client()
+    requests = {
+        settings.OLLAMA_MODEL_NAME: client.post(
+            f"{base}/api/generate",
+            json={"model": settings.OLLAMA_MODEL_NAME, "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+        ),
+        settings.OLLAMA_EMBED_MODEL_NAME: client.post(
+            f"{base}/api/embed",
+            json={"model": settings.OLLAMA_EMBED_MODEL_NAME, "input": "warm-up", "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+        ),
+    }
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(asyncio.wait_for(request, timeout=settings.OLLAMA_WARMUP_TIMEOUT_SECONDS) for request in requests.values()),
+        return_exceptions=True,
+    )
+    for model, result in zip(requests, results):
+        if isinstance(result, Exception):
+            log.warning(f"[ollama] warm-up of {model} failed: {result!r}")
+        elif result.status_code >= 400:
+            log.warning(f"[ollama] warm-up of {model} failed: HTTP {result.status_code} {result.text[:200]}")
+    log.info(f"[ollama] warm-up finished in {time.perf_counter() - started:.1f}s")
+
+
 def get_embedding_model():
     return OllamaEmbeddings(
         base_url=settings.OLLAMA_BASE_URL,
         model=settings.OLLAMA_EMBED_MODEL_NAME,
     )
+
+
+@traced("ollama.embed")
+async def aembed(texts: List[str]) -> List[List[float]]:
+    """
+    Async embeddings over the shared HTTP pool (same /api/embed endpoint OllamaEmbeddings uses).
+    """
+    base = settings.OLLAMA_BASE_URL.rstrip("/")
+    resp = await get_http_client().post(
+        f"{base}/api/embed",
+        json={"model": settings.OLLAMA_EMBED_MODEL_NAME, "input": texts, "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+    )
+    resp.raise_for_status()
+    return resp.json()["embeddings"]
@@ -13,3 +13,11 @@ def get_qdrant() -> QdrantClient:
             api_key=settings.QDRANT_API_KEY,
         )
     return _client
+
+
+def qdrant_url(path: str) -> str:
+    return f"{settings.QDRANT_URL.rstrip('/')}/{path.lstrip('/')}"
+
+
+def qdrant_headers() -> dict:
+    return {"api-key": settings.QDRANT_API_KEY} if settings.QDRANT_API_KEY else {}
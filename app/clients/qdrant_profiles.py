@@ -0,0 +1,185 @@
+import logging
+from typing import Any, Dict
+
+from qdrant_client.http import models
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+# Storage/index layout of the book collections. RAM per point is roughly
+# vectors (dim * 4 bytes, unless on disk) + quantized copies + HNSW links.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # Qdrant defaults: float32 vectors, HNSW graph and payload in RAM.
+    "default": {
+        "quantization": None,
+        "on_disk_vectors": False,
+        "on_disk_payload": False,
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 100,
+        "hnsw_on_disk": False,
+        "hnsw_ef": None,
+        "oversampling": None,
+    },
+    # int8 copies in RAM (4x smaller); original vectors on disk, read only to
+    # rescore the oversampled candidates.
+    "scalar": {
+        "quantization": "scalar",
+        "on_disk_vectors": True,
+        "on_disk_payload": False,
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 128,
+        "hnsw_on_disk": False,
+        "hnsw_ef": 128,
+        "oversampling": 2.0,
+    },
+    # 1 bit per dimension in RAM (32x smaller); coarser, so more oversampling.
+    "binary": {
+        "quantization": "binary",
+        "on_disk_vectors": True,
+        "on_disk_payload": False,
+        "hnsw_m": 16,
+        "hnsw_ef_construct": 128,
+        "hnsw_on_disk": False,
+        "hnsw_ef": 128,
+        "oversampling": 3.0,
+    },
+    # Smallest footprint: int8 copies are the only vectors in RAM, the HNSW
+    # graph and the payload (chunk texts with CHUNK_STORE_BACKEND=payload) are on disk.
+    "low_memory": {
+        "quantization": "scalar",
+        "on_disk_vectors": True,
+        "on_disk_payload": True,
+        "hnsw_m": 12,
+        "hnsw_ef_construct": 100,
+        "hnsw_on_disk": True,
+        "hnsw_ef": 96,
+        "oversampling": 2.0,
+    },
+}
+
+PAYLOAD_INDEXES = {
+    "book_id": models.PayloadSchemaType.KEYWORD,
+    "theory": models.PayloadSchemaType.KEYWORD,
+    "page_start": models.PayloadSchemaType.INTEGER,
+    "page_end": models.PayloadSchemaType.INTEGER,
+}
+
+
+def get_profile(name: str | None = None) -> Dict[str, Any]:
+    """
+    Profile by name (QDRANT_COLLECTION_PROFILE by default) with the
+    QDRANT_HNSW_* overrides applied.
+    """
+    name = name or settings.QDRANT_COLLECTION_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown Qdrant collection profile {name!r}, expected one of {', '.join(PROFILES)}")
+    profile = dict(PROFILES[name], name=name)
+    for field, override in (
+        ("hnsw_m", settings.QDRANT_HNSW_M),
+        ("hnsw_ef_construct", settings.QDRANT_HNSW_EF_CONSTRUCT),
+        ("hnsw_ef", settings.QDRANT_HNSW_EF),
+    ):
+        if override is not None:
+            profile[field] = override
+    return profile
+
+
+def _quantization_config(profile: Dict[str, Any]):
+    if profile["quantization"] == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if profile["quantization"] == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def _hnsw_config(profile: Dict[str, Any]) -> models.HnswConfigDiff:
+    return models.HnswConfigDiff(
+        m=profile["hnsw_m"],
+        ef_construct=profile["hnsw_ef_construct"],
+        on_disk=profile["hnsw_on_disk"],
+    )
+
+
+def _matches(config: Any, profile: Dict[str, Any]) -> bool:
+    vectors = config.params.vectors
+    quantization = config.quantization_config
+    current_quantization = None
+    if isinstance(quantization, models.ScalarQuantization):
+        current_quantization = "scalar"
+    elif isinstance(quantization, models.BinaryQuantization):
+        current_quantization = "binary"
+    return (
+        current_quantization == profile["quantization"]
+        and bool(getattr(vectors, "on_disk", False)) == profile["on_disk_vectors"]
+        and bool(config.params.on_disk_payload) == profile["on_disk_payload"]
+        and config.hnsw_config.m == profile["hnsw_m"]
+        and config.hnsw_config.ef_construct == profile["hnsw_ef_construct"]
+        and bool(config.hnsw_config.on_disk) == profile["hnsw_on_disk"]
+    )
+
+
+def apply_profile(client, collection: str, dim: int, exists: bool, profile: Dict[str, Any] | None = None) -> None:
+    """
+    Creates the collection with the profile, or updates an existing one in
+    place when its configuration differs (Qdrant rebuilds the quantized
+    vectors / HNSW graph in the background). Payload indexes are ensured
+    either way.
+    """
+    profile = profile or get_profile()
+    if not exists:
+        client.create_collection(
+            collection_name=collection,
+            vectors_config=models.VectorParams(
+                size=dim,
+                distance=models.Distance.COSINE,
+                on_disk=profile["on_disk_vectors"],
+            ),
+            hnsw_config=_hnsw_config(profile),
+            quantization_config=_quantization_config(profile),
+            on_disk_payload=profile["on_disk_payload"],
+        )
+    elif not _matches(client.get_collection(collection).config, profile):
+        log.info(f"[qdrant] applying profile {profile['name']} to existing collection {collection}")
+        client.update_collection(
+            collection_name=collection,
+            vectors_config={"": models.VectorParamsDiff(on_disk=profile["on_disk_vectors"])},
+            hnsw_config=_hnsw_config(profile),
+            quantization_config=_quantization_config(profile) or models.Disabled.DISABLED,
+            collection_params=models.CollectionParamsDiff(on_disk_payload=profile["on_disk_payload"]),
+        )
+    for field, schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(collection_name=collection, field_name=field, field_schema=schema, wait=False)
+
+
+def search_params(profile: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """
+    `params` of a Qdrant REST search request for the profile ({} = server defaults).
+    """
+    profile = profile or get_profile()
+    params: Dict[str, Any] = {}
+    if profile["hnsw_ef"]:
+        params["hnsw_ef"] = profile["hnsw_ef"]
+    if profile["quantization"]:
+        params["quantization"] = {"rescore": True, "oversampling": profile["oversampling"]}
+    return params
+
+
+def estimate_ram_bytes(points: int, dim: int, profile: Dict[str, Any]) -> int:
+    """
+    Rough RAM estimate of the vector index (payload excluded): float32
+    vectors unless on disk, quantized copies, and HNSW links (2m per point
+    on layer 0, 4 bytes each) unless the graph is on disk.
+    """
+    total = 0
+    if not profile["on_disk_vectors"]:
+        total += points * dim * 4
+    if profile["quantization"] == "scalar":
+        total += points * dim
+    elif profile["quantization"] == "binary":
+        total += points * dim // 8
+    if not profile["hnsw_on_disk"]:
+        total += points * profile["hnsw_m"] * 2 * 4
+    return total
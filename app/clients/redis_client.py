@@ -1,8 +1,11 @@
 import redis
+import redis.asyncio as aioredis
 
 from app.config import settings
 
 _redis: redis.Redis | None = None
+_async_redis: aioredis.Redis | None = None
+_async_redis_bytes: aioredis.Redis | None = None
 
 
 def get_redis() -> redis.Redis:
@@ -10,3 +13,40 @@ def get_redis() -> redis.Redis:
     if _redis is None:
         _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
     return _redis
+
+
+def get_async_redis() -> aioredis.Redis:
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_redis
+
+
+def get_async_redis_bytes() -> aioredis.Redis:
+    """
+    Same server, raw bytes responses (binary values such as packed vectors).
+    """
+    global _async_redis_bytes
+    if _async_redis_bytes is None:
+        _async_redis_bytes = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=False)
+    return _async_redis_bytes
+
+
+async def count_stat(key: str, field: str) -> None:
+    """
+    HINCRBY on a stats hash; best effort, a counter never fails a request.
+    """
+    try:
+        await get_async_redis().hincrby(key, field, 1)
+    except Exception:
+        pass
+
+
+async def close_async_redis() -> None:
+    global _async_redis, _async_redis_bytes
+    if _async_redis is not None:
+        await _async_redis.aclose()
+        _async_redis = None
+    if _async_redis_bytes is not None:
+        await _async_redis_bytes.aclose()
+        _async_redis_bytes = None
@@ -6,6 +6,9 @@ class Settings(BaseSettings):
     OLLAMA_BASE_URL: str = "http://ollama:11434"
     OLLAMA_MODEL_NAME: str = "qwen3:8b"
     OLLAMA_EMBED_MODEL_NAME: str = "embeddinggemma"
+    OLLAMA_KEEP_ALIVE: str = "24h"
+    OLLAMA_WARMUP_ON_STARTUP: bool = True
+    OLLAMA_WARMUP_TIMEOUT_SECONDS: float = 300.0
 
     # Qdrant
     QDRANT_URL: str = "http://qdrant:6333"
@@ -14,18 +17,133 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://redis:6379/0"
 
+    # Shared async HTTP pool (Ollama + Qdrant REST)
+    HTTP_TIMEOUT_SECONDS: float = 600.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+
     # Paths (inside container)
     JSON_INPUT_DIR: str = "/app/results/recognition_json"
     CHUNKS_DIR: str = "/app/chunks"
+    INGEST_MANIFEST_PATH: str = "/app/chunks/ingest_manifest.json"
 
     # Collections
     QDRANT_COLLECTION_CLS: str = "cls_ogata"
     QDRANT_COLLECTION_DS: str = "ds_ogata"
     QDRANT_COLLECTION_NL: str = "nl_khalil"
+    QDRANT_COLLECTION_ANSWER_CACHE: str = "answer_cache"
+
+    # Collection profile of the book collections (app/clients/qdrant_profiles.py):
+    # "default", "scalar", "binary" or "low_memory" - quantization, on-disk
+    # vectors/payload and HNSW build settings applied by ingest (existing
+    # collections are updated in place), plus search-time hnsw_ef/rescoring.
+    # QDRANT_HNSW_* override the profile's values.
+    QDRANT_COLLECTION_PROFILE: str = "default"
+    QDRANT_HNSW_M: int | None = None
+    QDRANT_HNSW_EF_CONSTRUCT: int | None = None
+    QDRANT_HNSW_EF: int | None = None
+
+    # Ingest pipeline
+    INGEST_PARSE_WORKERS: int = 2
+    INGEST_STREAM_MIN_BYTES: int = 32 * 1024 * 1024
+    INGEST_EMBED_BATCH_SIZE: int = 32
+    INGEST_EMBED_CONCURRENCY: int = 2
+    INGEST_UPSERT_CONCURRENCY: int = 2
+
+    # Chunk text storage: "payload" (inline in Qdrant), "mmap" (CHUNKS_DIR/chunks.bin) or "files"
+    CHUNK_STORE_BACKEND: str = "payload"
+    # mmap: rewrite chunks.bin once this share of it belongs to removed/replaced chunks
+    CHUNK_STORE_COMPACT_RATIO: float = 0.5
 
     # Chunking
     MAX_TOKENS_PER_CHUNK: int = 512
-    PAGES_PER_CHUNK: int = 1
+    PAGES_PER_CHUNK: int = 2
+    CHUNK_MIN_TOKENS: int = 128
+    CHUNK_OVERLAP_TOKENS: int = 64
+
+    # Embedding cache (in-process LRU in front of Redis, float32 vectors)
+    EMBED_CACHE_ENABLED: bool = True
+    EMBED_CACHE_LRU_SIZE: int = 4096
+    EMBED_CACHE_TTL_SECONDS: int = 30 * 24 * 60 * 60
+
+    # Hybrid retrieval: dense Qdrant search fused with a local BM25 index
+    HYBRID_SEARCH_ENABLED: bool = True
+    BM25_INDEX_DIR: str = "/app/chunks/bm25"
+
+    # Rerank: over-fetch RERANK_FETCH_K hits, keep the tool's top-k.
+    # RERANK_MODEL is an optional sentence-transformers cross-encoder (CPU);
+    # without it a vector + BM25 blend over the candidates is used.
+    RERANK_ENABLED: bool = True
+    RERANK_FETCH_K: int = 30
+    RERANK_LEXICAL_WEIGHT: float = 0.3
+    RERANK_MODEL: str | None = None
+
+    # LLM scheduler (per API worker): concurrent chat calls, queue length and
+    # queue wait before 429/503. Keep LLM_MAX_CONCURRENCY * workers at Ollama's
+    # OLLAMA_NUM_PARALLEL.
+    LLM_MAX_CONCURRENCY: int = 2
+    LLM_MAX_QUEUE: int = 16
+    LLM_MAX_QUEUE_WAIT_SECONDS: float = 60.0
+
+    # Router-first: classify the question by book (chunk-vector centroids from
+    # ingest + keywords) and prefetch its chunks before the first LLM call
+    ROUTER_ENABLED: bool = True
+    ROUTER_CENTROIDS_PATH: str = "/app/chunks/router_centroids.json"
+    ROUTER_MIN_MARGIN: float = 0.02
+
+    # Final answer language: translate only when the Cyrillic share of the
+    # letters is below LANGUAGE_MIN_CYRILLIC_RATIO
+    LANGUAGE_ENFORCE_ENABLED: bool = True
+    LANGUAGE_MIN_CYRILLIC_RATIO: float = 0.5
+    LANGUAGE_MIN_LETTERS: int = 20
+
+    # Agent loop budget: at most AGENT_MAX_TOOL_ROUNDS search rounds and
+    # AGENT_DEADLINE_SECONDS per request; the loop also stops once a round
+    # finds a chunk with score (cosine) >= AGENT_STOP_SCORE or nothing new.
+    # A stopped loop ends with one LLM call without tools.
+    AGENT_MAX_TOOL_ROUNDS: int = 3
+    AGENT_DEADLINE_SECONDS: float = 90.0
+    AGENT_STOP_SCORE: float = 0.75
+
+    # Tool execution
+    TOOL_TIMEOUT_SECONDS: float = 120.0
+    TOOL_MAX_CONCURRENCY_PER_REQUEST: int = 3
+
+    # Tool context budget (estimated tokens)
+    TOOL_CHUNK_MAX_TOKENS: int = 220
+    TOOL_CONTEXT_MAX_TOKENS: int = 2500
+
+    # Answer cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    ANSWER_CACHE_SEMANTIC_ENABLED: bool = True
+    ANSWER_CACHE_SEMANTIC_THRESHOLD: float = 0.92
+
+    # Batch endpoint / jobs
+    BATCH_MAX_QUESTIONS: int = 500
+    BATCH_CONCURRENCY: int = 2
+    BATCH_MAX_CONCURRENCY: int = 8
+    BATCH_JOB_TTL_SECONDS: int = 7 * 24 * 60 * 60
+
+    # Single-flight: identical in-flight questions share one graph run
+    # (in-process task + Redis lock/pub-sub across workers)
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_LOCK_TTL_SECONDS: int = 900
+    SINGLE_FLIGHT_WAIT_SECONDS: float = 900.0
+    SINGLE_FLIGHT_RESULT_TTL_SECONDS: int = 60
+
+    # Conversation sessions (Redis session:<id>): the last turns are replayed as
+    # chat history, chunks shown in earlier turns are pinned into the system
+    # message; follow-ups covered by them skip the router prefetch
+    SESSION_TTL_SECONDS: int = 24 * 60 * 60
+    SESSION_MAX_TURNS: int = 6
+    SESSION_MAX_PINNED_CHUNKS: int = 12
+    SESSION_PINNED_MAX_TOKENS: int = 3000
+    SESSION_FOLLOWUP_MIN_OVERLAP: float = 0.6
+
+    # Tracing: log every span with the request's trace id
+    TRACE_LOG_SPANS: bool = True
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
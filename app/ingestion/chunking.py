@@ -1,32 +1,189 @@
-from typing import Dict, List
+import logging
+import re
+from typing import Dict, Iterator, List, Tuple
 
+from app.config import settings
+from app.utils.tokens import estimate_tokens
 
-def build_chunks_from_pages(doc: Dict) -> List[Dict]:
+log = logging.getLogger(__name__)
+
+# Dolphin-style element labels. Formulas/captions belong to the paragraph
+# before them, headings to the paragraph after them.
+ATTACH_TO_PREVIOUS = {
+    "formula", "equation", "equ", "cap", "caption", "fig_cap", "tab_cap",
+    "figure_caption", "table_caption", "fnote", "footnote",
+}
+ATTACH_TO_NEXT = {"title", "sec", "sub_sec", "header", "heading", "section_header"}
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def _page_blocks(page: Dict) -> List[str]:
+    elements = sorted(page["elements"], key=lambda e: e.get("reading_order", 0))
+    blocks: List[List[str]] = []
+    headings: List[str] = []
+    for el in elements:
+        text = el.get("text")
+        if not text:
+            continue
+        label = (el.get("label") or el.get("type") or "").lower()
+        if label in ATTACH_TO_NEXT:
+            headings.append(text)
+        elif label in ATTACH_TO_PREVIOUS and blocks and not headings:
+            blocks[-1].append(text)
+        else:
+            blocks.append(headings + [text])
+            headings = []
+    if headings:
+        blocks.append(headings)
+    return ["\n".join(block) for block in blocks]
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
     """
-    Make one chunk per page (ordered by reading_order).
+    A single block above the budget is cut at sentence, then word, boundaries.
     """
-    chunks = []
-    pages = sorted(doc["pages"], key=lambda p: p["page_number"])
-    for page in pages:
-        page_no = page["page_number"]
-        elements = sorted(page["elements"], key=lambda e: e.get("reading_order", 0))
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    pieces: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    units: List[str] = []
+    for sentence in _SENTENCE_RE.split(text):
+        if estimate_tokens(sentence) <= max_tokens:
+            units.append(sentence)
+        else:
+            units.extend(sentence.split())
+    for unit in units:
+        n = estimate_tokens(unit)
+        if current and current_tokens + n > max_tokens:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += n
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def iter_chunks(doc: Dict) -> Iterator[Dict]:
+    """
+    Token-budgeted windows over element blocks:
+    - a chunk holds at most MAX_TOKENS_PER_CHUNK (estimated) tokens and spans
+      at most PAGES_PER_CHUNK pages;
+    - a page boundary closes the window only once it has CHUNK_MIN_TOKENS,
+      so sparse pages are merged with the next one;
+    - the last blocks of a closed window (up to CHUNK_OVERLAP_TOKENS) are
+      repeated at the start of the next one when the page span allows.
+    Pages are consumed lazily in the given order; a page numbered at or below
+    the previous one closes the window without overlap, so a span never runs
+    backwards. `id_key` is stable across runs:
+    "<source_file>:<page_start>:<page_end>" for the first chunk of a span,
+    with ":<n>" appended for the following ones.
+    """
+    max_tokens = settings.MAX_TOKENS_PER_CHUNK
+    max_pages = max(1, settings.PAGES_PER_CHUNK)
+    meta = {
+        "source_file": doc["source_file"],
+        "json_path": str(doc["json_path"]),
+        "book_id": doc["book_id"],
+        "theory": doc["theory"],
+    }
+    window: List[Tuple[int, str, int]] = []  # (page_number, text, tokens)
+    fresh = 0  # blocks in the window that were not carried over
+    spans: Dict[Tuple[int, int], int] = {}
+
+    def emit() -> Dict:
+        start, end = window[0][0], window[-1][0]
+        n = spans.get((start, end), 0)
+        spans[(start, end)] = n + 1
+        key = f"{doc['source_file']}:{start}:{end}"
+        return {
+            "text": "\n".join(text for _, text, _ in window),
+            "page_start": start,
+            "page_end": end,
+            "id_key": key if n == 0 else f"{key}:{n}",
+            "meta": meta,
+        }
 
-        texts = [el["text"] for el in elements if el.get("text")]
-        if not texts:
+    def overlap_tail() -> List[Tuple[int, str, int]]:
+        tail: List[Tuple[int, str, int]] = []
+        total = 0
+        for item in reversed(window[1:]):
+            if total + item[2] > settings.CHUNK_OVERLAP_TOKENS:
+                break
+            tail.insert(0, item)
+            total += item[2]
+        if not tail and window:
+            # No whole block fits the overlap budget: repeat the last sentences.
+            page_no, text, _ = window[-1]
+            sentences = _SENTENCE_RE.split(text)
+            picked: List[str] = []
+            for sentence in reversed(sentences[1:]):
+                n = estimate_tokens(sentence)
+                if total + n > settings.CHUNK_OVERLAP_TOKENS:
+                    break
+                picked.insert(0, sentence)
+                total += n
+            if picked:
+                tail = [(page_no, " ".join(picked), total)]
+        return tail
+
+    last_page = None
+    for page in doc["pages"]:
+        page_no = page["page_number"]
+        blocks = _page_blocks(page)
+        if not blocks:
             continue
 
-        text = "\n".join(texts)
-        chunks.append(
-            {
-                "text": text,
-                "page_start": page_no,
-                "page_end": page_no,
-                "meta": {
-                    "source_file": doc["source_file"],
-                    "json_path": str(doc["json_path"]),
-                    "book_id": doc["book_id"],
-                    "theory": doc["theory"],
-                },
-            }
-        )
-    return chunks
+        if last_page is not None and page_no <= last_page:
+            log.warning(f"[chunking] {doc['source_file']}: page {page_no} follows page {last_page}")
+            if fresh:
+                yield emit()
+            window, fresh = [], 0
+        last_page = page_no
+
+        # Carried-over overlap must not push the window past the page limit.
+        carried = len(window) - fresh
+        while carried and page_no - window[0][0] + 1 > max_pages:
+            window.pop(0)
+            carried -= 1
+
+        if window:
+            span = page_no - window[0][0] + 1
+            if span > max_pages or sum(w[2] for w in window) >= settings.CHUNK_MIN_TOKENS:
+                if fresh:
+                    yield emit()
+                window = [w for w in overlap_tail() if page_no - w[0] + 1 <= max_pages]
+                fresh = 0
+
+        for block in blocks:
+            for piece in _split_oversized(block, max_tokens):
+                n = estimate_tokens(piece)
+                if window and sum(w[2] for w in window) + n > max_tokens:
+                    if fresh:
+                        yield emit()
+                        window = overlap_tail()
+                    while window and sum(w[2] for w in window) + n > max_tokens:
+                        window.pop(0)
+                    fresh = 0
+                window.append((page_no, piece, n))
+                fresh += 1
+
+    if window and fresh:
+        yield emit()
+
+
+def chunking_fingerprint() -> str:
+    """
+    The settings that shape chunk boundaries; stored in the ingest manifest so
+    changing any of them triggers a full rebuild.
+    """
+    return (
+        f"max_tokens={settings.MAX_TOKENS_PER_CHUNK},pages={settings.PAGES_PER_CHUNK},"
+        f"min_tokens={settings.CHUNK_MIN_TOKENS},overlap={settings.CHUNK_OVERLAP_TOKENS}"
+    )
+
+
+def build_chunks_from_pages(doc: Dict) -> List[Dict]:
+    return list(iter_chunks(doc))
@@ -1,15 +1,27 @@
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
+from qdrant_client.http.models import PointIdsList, PointStruct
 from qdrant_client.http.exceptions import UnexpectedResponse
 
+from app.agents.answer_cache import bump_corpus_version
+from app.agents.router import THEORY_COLLECTIONS, centroids_path, compute_centroids, save_centroids
 from app.config import settings
-from app.clients.ollama_client import get_embedding_model
+from app.clients.embedding_cache import aembed_cached
+from app.clients.http_client import close_http_client
 from app.clients.qdrant_client import get_qdrant
-from app.clients.redis_client import get_redis
-from app.ingestion.parse_json import iter_documents
-from app.ingestion.chunking import build_chunks_from_pages
+from app.clients.qdrant_profiles import apply_profile, get_profile
+from app.clients.redis_client import close_async_redis, get_redis
+from app.ingestion.chunking import build_chunks_from_pages, chunking_fingerprint
+from app.ingestion.manifest import empty_manifest, file_sha1, load_manifest, save_manifest, text_sha1
+from app.ingestion.parse_json import iter_json_files, load_document
+from app.retrieval.bm25 import BM25Index, index_path
+from app.storage.chunk_store import get_chunk_store
 from app.utils.hashing import make_chunk_id
 
 
@@ -24,90 +36,332 @@ def _collection_exists(client, name: str) -> bool:
             return False
 
 
-def ensure_collections(embedder) -> None:
+async def ensure_collections(recreate: bool = False) -> None:
+    """
+    Creates the book collections with QDRANT_COLLECTION_PROFILE, or brings
+    existing ones to it.
+    """
     client = get_qdrant()
+    profile = get_profile()
     try:
-        dim = len(embedder.embed_query("dimension_probe"))
+        dim = len((await aembed_cached(["dimension_probe"]))[0])
     except Exception as exc:
         raise RuntimeError(
             "Embedding model is not available in Ollama. "
             "Pull it first: `ollama pull ${OLLAMA_EMBED_MODEL_NAME}` "
             f"(current: {settings.OLLAMA_EMBED_MODEL_NAME}). Original error: {exc}"
         )
-    for name in (
-        settings.QDRANT_COLLECTION_CLS,
-        settings.QDRANT_COLLECTION_DS,
-        settings.QDRANT_COLLECTION_NL,
-    ):
-        if not _collection_exists(client, name):
-            client.recreate_collection(
-                collection_name=name,
-                vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
-            )
-
-
-def ingest() -> None:
+    for name in THEORY_COLLECTIONS.values():
+        exists = _collection_exists(client, name)
+        if exists and recreate:
+            client.delete_collection(collection_name=name)
+            exists = False
+        apply_profile(client, name, dim, exists, profile)
+    print(f"Collections use the {profile['name']} profile")
+
+
+def _prepare_document(path_str: str, previous: Optional[Dict]) -> Dict:
+    """
+    Runs in a worker process: hash, parse and chunk one JSON file and diff it
+    against its previous manifest entry.
+    """
+    started = time.perf_counter()
+    path = Path(path_str)
+    file_hash = file_sha1(path)
+    if previous and previous["sha1"] == file_hash:
+        return {
+            "key": path_str,
+            "entry": previous,
+            "unchanged": True,
+            "parse_seconds": time.perf_counter() - started,
+        }
+
+    doc = load_document(path)
+    collection = THEORY_COLLECTIONS[doc["theory"]]
+    page_count = 0
+
+    def counted(pages):
+        nonlocal page_count
+        for page in pages:
+            page_count += 1
+            yield page
+
+    doc["pages"] = counted(doc["pages"])
+    chunks = build_chunks_from_pages(doc)
+
+    entries: List[Tuple[str, Dict, str]] = []
+    for chunk in chunks:
+        chunk_id = make_chunk_id(chunk["id_key"])
+        entries.append((chunk_id, chunk, text_sha1(chunk["text"])))
+    entry = {
+        "sha1": file_hash,
+        "collection": collection,
+        "chunks": {chunk_id: text_hash for chunk_id, _, text_hash in entries},
+    }
+
+    stale: List[Tuple[str, List[str]]] = []
+    old_chunks: Dict[str, str] = previous["chunks"] if previous else {}
+    if previous and previous["collection"] != collection:
+        stale.append((previous["collection"], list(old_chunks)))
+        old_chunks = {}
+    removed = [cid for cid in old_chunks if cid not in entry["chunks"]]
+    if removed:
+        stale.append((collection, removed))
+
+    to_embed: List[Tuple[str, str, Dict]] = []
+    for chunk_id, chunk, text_hash in entries:
+        if old_chunks.get(chunk_id) == text_hash:
+            continue
+        payload = {
+            "chunk_id": chunk_id,
+            "source_file": chunk["meta"]["source_file"],
+            "book_id": chunk["meta"]["book_id"],
+            "theory": chunk["meta"]["theory"],
+            "page_start": chunk["page_start"],
+            "page_end": chunk["page_end"],
+        }
+        to_embed.append((chunk_id, chunk["text"], payload))
+
+    return {
+        "key": path_str,
+        "entry": entry,
+        "unchanged": False,
+        "source_file": doc["source_file"],
+        "collection": collection,
+        "pages": page_count,
+        "chunks": len(chunks),
+        "stale": stale,
+        "to_embed": to_embed,
+        "parse_seconds": time.perf_counter() - started,
+    }
+
+
+async def _delete_points(
+    qdrant,
+    chunk_store,
+    bm25: Dict[str, BM25Index],
+    collection: str,
+    chunk_ids: List[str],
+) -> None:
+    """
+    Only the blocking Qdrant call runs in a worker thread: the chunk store
+    and the BM25 indexes are not thread-safe and are updated on the event
+    loop thread, like the put/add calls of the embed workers.
+    """
+    if not chunk_ids:
+        return
+    await asyncio.to_thread(qdrant.delete, collection_name=collection, points_selector=PointIdsList(points=chunk_ids))
+    chunk_store.remove(chunk_ids)
+    if collection in bm25:
+        bm25[collection].remove(chunk_ids)
+
+
+async def _wait_for_points(qdrant, collection: str, expected: int, timeout: float = 60.0) -> None:
+    """
+    Upserts are sent with wait=False; let Qdrant apply them before the
+    collection is read back.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if qdrant.count(collection_name=collection, exact=True).count >= expected:
+            return
+        await asyncio.sleep(0.5)
+    print(f"Warning: {collection} still has fewer than {expected} points after {timeout:.0f}s")
+
+
+async def ingest_async(full: bool = False) -> None:
+    """
+    Incremental by default: a manifest of file and chunk content hashes lets
+    unchanged files be skipped, only new/changed chunks be embedded and
+    upserted, and points of removed pages/files be deleted. `full` drops the
+    collections and rebuilds everything.
+
+    Stages overlap: JSON files are parsed and chunked in a process pool (a
+    bounded window of files in flight), embeddings are requested in fixed-size batches by a bounded number of
+    concurrent workers, and each embedded batch is upserted (wait=False)
+    while the next batches are being embedded.
+    """
     qdrant = get_qdrant()
-    embedder = get_embedding_model()
     redis_client = get_redis()
+    chunk_store = get_chunk_store()
 
-    ensure_collections(embedder)
+    manifest = load_manifest(
+        settings.INGEST_MANIFEST_PATH,
+        settings.OLLAMA_EMBED_MODEL_NAME,
+        settings.CHUNK_STORE_BACKEND,
+        chunking_fingerprint(),
+    )
+    bm25_missing = settings.HYBRID_SEARCH_ENABLED and not all(
+        index_path(c).exists() for c in THEORY_COLLECTIONS.values()
+    )
+    if full or not manifest["files"] or bm25_missing:
+        # A missing/stale manifest means the collections may hold anything;
+        # a missing BM25 index can only be rebuilt from the chunk texts.
+        full = True
+        manifest = empty_manifest(
+            settings.OLLAMA_EMBED_MODEL_NAME, settings.CHUNK_STORE_BACKEND, chunking_fingerprint()
+        )
+        # Persisted before the collections are dropped: if this run aborts, the
+        # next one sees an empty manifest and rebuilds again instead of trusting
+        # file hashes that no longer match what Qdrant holds.
+        save_manifest(settings.INGEST_MANIFEST_PATH, manifest)
 
-    chunks_dir = Path(settings.CHUNKS_DIR)
-    chunks_dir.mkdir(parents=True, exist_ok=True)
+    await ensure_collections(recreate=full)
+    if full:
+        chunk_store.reset()
+    bm25: Dict[str, BM25Index] = {}
+    if settings.HYBRID_SEARCH_ENABLED:
+        bm25 = {c: BM25Index() if full else BM25Index.load(index_path(c)) for c in THEORY_COLLECTIONS.values()}
 
-    for doc in iter_documents(settings.JSON_INPUT_DIR):
-        chunks = build_chunks_from_pages(doc)
-        if not chunks:
-            continue
+    old_files: Dict[str, Dict] = manifest["files"]
+    new_files: Dict[str, Dict] = {}
+    changed = full
+    timings: Dict[str, float] = defaultdict(float)
+    counts: Dict[str, int] = defaultdict(int)
+    started = time.perf_counter()
+
+    embed_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_EMBED_CONCURRENCY * 2)
+    upsert_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_UPSERT_CONCURRENCY * 2)
+
+    async def embed_worker() -> None:
+        while True:
+            batch = await embed_queue.get()
+            if batch is None:
+                return
+            collection, items = batch
+            t0 = time.perf_counter()
+            vectors = await aembed_cached([text for _, text, _ in items])
+            timings["embed"] += time.perf_counter() - t0
+            points: List[PointStruct] = []
+            for (chunk_id, text, payload), vector in zip(items, vectors):
+                chunk_store.put(chunk_id, text, payload)
+                points.append(PointStruct(id=chunk_id, vector=vector, payload=payload))
+            await upsert_queue.put((collection, points))
+
+    async def upsert_worker() -> None:
+        while True:
+            item = await upsert_queue.get()
+            if item is None:
+                return
+            collection, points = item
+            t0 = time.perf_counter()
+            await asyncio.to_thread(qdrant.upsert, collection_name=collection, points=points, wait=False)
+            timings["upsert"] += time.perf_counter() - t0
+            counts["upserted"] += len(points)
+
+    async def handle(prepared: Dict) -> None:
+        nonlocal changed
+        timings["parse"] += prepared["parse_seconds"]
+        new_files[prepared["key"]] = prepared["entry"]
+        if prepared["unchanged"]:
+            return
+
+        counts["pages"] += prepared["pages"]
+        for collection, chunk_ids in prepared["stale"]:
+            await _delete_points(qdrant, chunk_store, bm25, collection, chunk_ids)
+            print(f"Removed {len(chunk_ids)} stale chunks from {collection} ({prepared['source_file']})")
+            changed = True
+
+        to_embed = prepared["to_embed"]
+        if not to_embed:
+            return
+        changed = True
+        counts["chunks"] += len(to_embed)
+        if prepared["collection"] in bm25:
+            for chunk_id, text, _ in to_embed:
+                bm25[prepared["collection"]].add(chunk_id, text)
+        print(
+            f"Queued {len(to_embed)} of {prepared['chunks']} chunks into "
+            f"{prepared['collection']} from {prepared['source_file']}"
+        )
+        size = settings.INGEST_EMBED_BATCH_SIZE
+        for i in range(0, len(to_embed), size):
+            await embed_queue.put((prepared["collection"], to_embed[i:i + size]))
+
+    async def produce() -> None:
+        # At most INGEST_PARSE_WORKERS * 2 files are parsed or waiting for the
+        # embed queue at a time, so parsed documents cannot pile up in memory
+        # when embedding is the slower stage.
+        loop = asyncio.get_running_loop()
+        window = max(1, settings.INGEST_PARSE_WORKERS * 2)
+        pending: set = set()
+
+        async def drain(limit: int) -> None:
+            nonlocal pending
+            while len(pending) > limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    await handle(future.result())
+
+        with ProcessPoolExecutor(max_workers=settings.INGEST_PARSE_WORKERS) as pool:
+            for path in iter_json_files(settings.JSON_INPUT_DIR):
+                key = str(path)
+                pending.add(loop.run_in_executor(pool, _prepare_document, key, old_files.get(key)))
+                await drain(window - 1)
+            await drain(0)
+
+    async with asyncio.TaskGroup() as tg:
+        embedders = [tg.create_task(embed_worker()) for _ in range(settings.INGEST_EMBED_CONCURRENCY)]
+        upserters = [tg.create_task(upsert_worker()) for _ in range(settings.INGEST_UPSERT_CONCURRENCY)]
+        await produce()
+        for _ in embedders:
+            await embed_queue.put(None)
+        await asyncio.gather(*embedders)
+        for _ in upserters:
+            await upsert_queue.put(None)
+
+    for key, previous in old_files.items():
+        if key not in new_files:
+            await _delete_points(qdrant, chunk_store, bm25, previous["collection"], list(previous["chunks"]))
+            print(f"Removed {len(previous['chunks'])} chunks of deleted file {key}")
+            changed = True
+
+    if settings.ROUTER_ENABLED and (changed or not centroids_path().exists()):
+        expected: Dict[str, int] = defaultdict(int)
+        for entry in new_files.values():
+            expected[entry["collection"]] += len(entry["chunks"])
+        for collection in THEORY_COLLECTIONS.values():
+            await _wait_for_points(qdrant, collection, expected[collection])
+        save_centroids(await asyncio.to_thread(compute_centroids, qdrant, THEORY_COLLECTIONS))
+        print(f"Router centroids saved to {centroids_path()}")
+
+    chunk_store.flush()
+    for collection, index in bm25.items():
+        # Untouched indexes keep their file (and mtime), so the API does not reload them.
+        if full or index.dirty:
+            index.save(index_path(collection))
+    manifest["files"] = new_files
+    save_manifest(settings.INGEST_MANIFEST_PATH, manifest)
+    if changed:
+        bump_corpus_version(redis_client, str(int(time.time())))
+    else:
+        print("Nothing changed since the last ingest")
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Ingest finished in {elapsed:.1f}s: {counts['pages']} pages, {counts['chunks']} chunks embedded, "
+        f"{counts['upserted']} points upserted ({counts['pages'] / elapsed if elapsed else 0.0:.2f} pages/s)"
+    )
+    print(
+        f"Stage time: parse {timings['parse']:.1f}s (sum over {settings.INGEST_PARSE_WORKERS} workers), "
+        f"embed {timings['embed']:.1f}s, upsert {timings['upsert']:.1f}s "
+        f"(sums over concurrent workers, stages overlap)"
+    )
+
+
+def ingest(full: bool = False) -> None:
+    async def run() -> None:
+        try:
+            await ingest_async(full=full)
+        finally:
+            await close_http_client()
+            await close_async_redis()
 
-        texts = [c["text"] for c in chunks]
-        vectors = embedder.embed_documents(texts)
-
-        collection = {
-            "linear": settings.QDRANT_COLLECTION_CLS,
-            "discrete": settings.QDRANT_COLLECTION_DS,
-            "nonlinear": settings.QDRANT_COLLECTION_NL,
-        }[doc["theory"]]
-
-        points: List[PointStruct] = []
-        for chunk, vector in zip(chunks, vectors):
-            chunk_id = make_chunk_id(
-                f"{doc['source_file']}:{chunk['page_start']}:{chunk['page_end']}"
-            )
-            txt_path = chunks_dir / f"{chunk_id}.txt"
-            txt_path.write_text(chunk["text"], encoding="utf-8")
-
-            payload = {
-                "chunk_id": chunk_id,
-                "source_file": chunk["meta"]["source_file"],
-                "book_id": chunk["meta"]["book_id"],
-                "theory": chunk["meta"]["theory"],
-                "page_start": chunk["page_start"],
-                "page_end": chunk["page_end"],
-            }
-
-            points.append(
-                PointStruct(
-                    id=chunk_id,
-                    vector=vector,
-                    payload=payload,
-                )
-            )
-
-            redis_client.hset(
-                f"chunk:{chunk_id}",
-                mapping={
-                    "path": str(txt_path),
-                    "book_id": payload["book_id"],
-                    "theory": payload["theory"],
-                },
-            )
-
-        if points:
-            qdrant.upsert(collection_name=collection, points=points)
-            print(f"Ingested {len(points)} chunks into {collection} from {doc['source_file']}")
+    asyncio.run(run())
 
 
 if __name__ == "__main__":
-    ingest()
+    parser = argparse.ArgumentParser(description="Ingest recognition JSON into Qdrant.")
+    parser.add_argument("--full", action="store_true", help="Drop collections and rebuild everything.")
+    args = parser.parse_args()
+    ingest(full=args.full)
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict
+
+MANIFEST_FORMAT = 1
+
+
+def file_sha1(path: Path) -> str:
+    digest = hashlib.sha1()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def empty_manifest(embed_model: str, chunk_store: str, chunking: str) -> Dict:
+    """
+    files: {json_path: {"sha1", "collection", "chunks": {chunk_id: text_sha1}}}
+    """
+    return {
+        "format": MANIFEST_FORMAT,
+        "embed_model": embed_model,
+        "chunk_store": chunk_store,
+        "chunking": chunking,
+        "files": {},
+    }
+
+
+def load_manifest(path: str, embed_model: str, chunk_store: str, chunking: str) -> Dict:
+    """
+    Returns the stored manifest, or an empty one when it is missing or was built
+    with another embedding model / chunk store / chunking parameters
+    (everything must be redone then).
+    """
+    manifest_path = Path(path)
+    if not manifest_path.exists():
+        return empty_manifest(embed_model, chunk_store, chunking)
+    with manifest_path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if (
+        data.get("format") != MANIFEST_FORMAT
+        or data.get("embed_model") != embed_model
+        or data.get("chunk_store") != chunk_store
+        or data.get("chunking") != chunking
+    ):
+        return empty_manifest(embed_model, chunk_store, chunking)
+    return data
+
+
+def save_manifest(path: str, manifest: Dict) -> None:
+    manifest_path = Path(path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = manifest_path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, manifest_path)
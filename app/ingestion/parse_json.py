@@ -1,22 +1,76 @@
-import json
 from pathlib import Path
-from typing import Dict, Generator
+from typing import Dict, Generator, Iterator, Tuple
 
+import ijson
+import orjson
+
+from app.config import settings
 from app.utils.paths import detect_theory_and_book
 
 
+def iter_json_files(json_dir: str) -> Generator[Path, None, None]:
+    yield from sorted(Path(json_dir).rglob("*.json"))
+
+
+def _read_header(path: Path) -> Tuple[str, int | None]:
+    """
+    Top-level `source_file` / `total_pages` via the event stream, without
+    materializing `pages`. The scan stops as soon as both are seen, or when
+    `pages` begins and `source_file` is known (`total_pages` is optional).
+    A `source_file` stored after `pages` is still found: the event stream is
+    read to it, slower but in bounded memory.
+    """
+    source_file = None
+    total_pages = None
+    with path.open("rb") as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix == "source_file" and event == "string":
+                source_file = value
+            elif prefix == "total_pages" and event == "number":
+                total_pages = int(value)
+            elif prefix == "pages" and event == "start_array" and source_file is not None:
+                break
+            if source_file is not None and total_pages is not None:
+                break
+    if source_file is None:
+        raise KeyError(f"source_file is missing in {path}")
+    return source_file, total_pages
+
+
+def iter_pages(path: Path) -> Iterator[Dict]:
+    """
+    Incremental parse of `pages`: one page dict in memory at a time.
+    """
+    with path.open("rb") as f:
+        yield from ijson.items(f, "pages.item", use_float=True)
+
+
+def load_document(path: Path) -> Dict:
+    """
+    Document header plus a lazy `pages` iterator (single pass). Files above
+    INGEST_STREAM_MIN_BYTES are streamed page by page in file order; smaller
+    ones are parsed with orjson in one shot, which is faster, and their pages
+    are sorted by page_number.
+    """
+    if path.stat().st_size < settings.INGEST_STREAM_MIN_BYTES:
+        with path.open("rb") as f:
+            data = orjson.loads(f.read())
+        pages = iter(sorted(data["pages"], key=lambda p: p["page_number"]))
+        source_file, total_pages = data["source_file"], data.get("total_pages")
+    else:
+        source_file, total_pages = _read_header(path)
+        pages = iter_pages(path)
+    theory, book_id = detect_theory_and_book(source_file)
+    return {
+        "json_path": path,
+        "source_file": source_file,
+        "theory": theory,
+        "book_id": book_id,
+        "total_pages": total_pages,
+        "pages": pages,
+    }
+
+
 def iter_documents(json_dir: str) -> Generator[Dict, None, None]:
-    base = Path(json_dir)
-    for path in base.rglob("*.json"):
-        with path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        source_file = data["source_file"]
-        theory, book_id = detect_theory_and_book(source_file)
-        yield {
-            "json_path": path,
-            "source_file": source_file,
-            "theory": theory,
-            "book_id": book_id,
-            "total_pages": data.get("total_pages"),
-            "pages": data["pages"],
-        }
+    for path in iter_json_files(json_dir):
+        yield load_document(path)
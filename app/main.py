@@ -1,14 +1,55 @@
 import logging
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
-from app.routers import agent, health
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
-# Basic logging setup
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+from app.agents.graph import close_llm_clients, get_llm_with_tools
+from app.agents.router import THEORY_COLLECTIONS
+from app.clients.http_client import close_http_client
+from app.clients.llm_scheduler import LLMOverloaded
+from app.clients.ollama_client import warm_up
+from app.clients.redis_client import close_async_redis
+from app.config import settings
+from app.retrieval.bm25 import get_bm25_index
+from app.routers import agent, health, metrics
+from app.storage.chunk_store import get_chunk_store
+from app.utils.tracing import TraceMiddleware, install_log_record_factory
+
+# Basic logging setup; every record carries the trace id of its request.
+install_log_record_factory()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(trace_id)s] %(name)s %(message)s")
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    get_chunk_store().preload()
+    if settings.HYBRID_SEARCH_ENABLED:
+        for collection in THEORY_COLLECTIONS.values():
+            await get_bm25_index(collection)
+    # Clients and the tool binding are created once here, not on the first request.
+    get_llm_with_tools()
+    if settings.OLLAMA_WARMUP_ON_STARTUP:
+        await warm_up()
+    yield
+    await close_llm_clients()
+    await close_http_client()
+    await close_async_redis()
+
+
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 def create_app() -> FastAPI:
-    application = FastAPI(title="Control System Agent", version="0.1.0")
+    application = FastAPI(title="Control System Agent", version="0.1.0", lifespan=lifespan)
+    application.add_exception_handler(LLMOverloaded, llm_overloaded_handler)
+    application.add_middleware(TraceMiddleware)
+    application.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
     application.include_router(health.router, prefix="/health", tags=["health"])
     application.include_router(agent.router, prefix="/v1", tags=["agent"])
     return application
@@ -0,0 +1,142 @@
+import asyncio
+import heapq
+import json
+import logging
+import math
+import os
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from app.config import settings
+from app.utils.tokens import tokenize
+
+log = logging.getLogger(__name__)
+
+
+class BM25Index:
+    """
+    Sparse lexical index over chunk texts of one collection.
+
+    Persisted as JSON {"docs": {chunk_id: {term: tf}}} so that ingest can
+    update it incrementally; postings are rebuilt in memory on load. `dirty`
+    tells ingest whether the file needs rewriting.
+    """
+
+    def __init__(self, docs: Dict[str, Dict[str, int]] | None = None, k1: float = 1.2, b: float = 0.75):
+        self.docs: Dict[str, Dict[str, int]] = docs or {}
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[str, int]]] | None = None
+        self._lengths: Dict[str, int] = {}
+        self._avg_len = 1.0
+        self.dirty = False
+
+    def add(self, chunk_id: str, text: str) -> None:
+        self.docs[chunk_id] = dict(Counter(tokenize(text)))
+        self._postings = None
+        self.dirty = True
+
+    def remove(self, chunk_ids: Iterable[str]) -> None:
+        for chunk_id in chunk_ids:
+            if self.docs.pop(chunk_id, None) is not None:
+                self.dirty = True
+        self._postings = None
+
+    def _build(self) -> None:
+        postings: Dict[str, List[Tuple[str, int]]] = {}
+        for chunk_id, terms in self.docs.items():
+            self._lengths[chunk_id] = sum(terms.values())
+            for term, tf in terms.items():
+                postings.setdefault(term, []).append((chunk_id, tf))
+        self._avg_len = (sum(self._lengths.values()) / len(self._lengths)) if self._lengths else 1.0
+        self._postings = postings
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        if self._postings is None:
+            self._build()
+        n = len(self.docs)
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / self._avg_len)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump({"docs": self.docs}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        if not path.exists():
+            return cls()
+        with path.open("r", encoding="utf-8") as f:
+            return cls(json.load(f)["docs"])
+
+
+def index_path(collection: str) -> Path:
+    return Path(settings.BM25_INDEX_DIR) / f"{collection}.json"
+
+
+_RELOAD_CHECK_SECONDS = 5.0
+
+_indexes: Dict[str, Tuple[float, BM25Index]] = {}
+_checked: Dict[str, float] = {}
+_reloads: Dict[str, asyncio.Task] = {}
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _load_built(path: Path) -> BM25Index:
+    index = BM25Index.load(path)
+    index._build()
+    return index
+
+
+async def _reload(collection: str, path: Path, mtime: float) -> None:
+    try:
+        _indexes[collection] = (mtime, await asyncio.to_thread(_load_built, path))
+        log.info(f"[bm25] reloaded {path}")
+    except Exception as exc:
+        log.error(f"[bm25] failed to reload {path}: {exc}")
+    finally:
+        _reloads.pop(collection, None)
+
+
+async def get_bm25_index(collection: str) -> BM25Index:
+    """
+    Index loaded once per process, in a worker thread. When ingest rewrites
+    the file (checked at most every _RELOAD_CHECK_SECONDS), the new version
+    is loaded and built in the background while searches keep using the
+    current one, so a reload never blocks the event loop.
+    """
+    path = index_path(collection)
+    cached = _indexes.get(collection)
+    now = time.monotonic()
+    if cached is None:
+        mtime = _mtime(path)
+        index = await asyncio.to_thread(_load_built, path)
+        _indexes[collection] = (mtime, index)
+        _checked[collection] = now
+        return index
+    if now - _checked.get(collection, 0.0) >= _RELOAD_CHECK_SECONDS:
+        _checked[collection] = now
+        mtime = _mtime(path)
+        if mtime != cached[0] and collection not in _reloads:
+            _reloads[collection] = asyncio.create_task(_reload(collection, path, mtime))
+    return cached[1]
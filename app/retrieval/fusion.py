@@ -0,0 +1,19 @@
+from typing import Dict, List
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], k: int, rrf_k: int = 60) -> List[Dict]:
+    """
+    Merge ranked chunk lists by reciprocal rank: score = sum(1 / (rrf_k + rank)).
+    Raw scores of different collections are not comparable, ranks are.
+    Chunks are matched by chunk_id; the first occurrence keeps its fields.
+    """
+    fused: Dict[str, Dict] = {}
+    for results in result_lists:
+        for rank, chunk in enumerate(results, start=1):
+            cid = chunk["chunk_id"]
+            entry = fused.get(cid)
+            if entry is None:
+                entry = fused[cid] = dict(chunk, rrf_score=0.0)
+            entry["rrf_score"] += 1.0 / (rrf_k + rank)
+    ranked = sorted(fused.values(), key=lambda c: c["rrf_score"], reverse=True)
+    return ranked[:k]
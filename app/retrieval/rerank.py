@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import math
+from collections import Counter
+from typing import Dict, List
+
+from app.config import settings
+from app.utils.tokens import tokenize
+from app.utils.tracing import traced
+
+log = logging.getLogger(__name__)
+
+_cross_encoder = None
+_cross_encoder_failed = False
+
+
+def _min_max(values: List[float]) -> List[float]:
+    lo, hi = min(values), max(values)
+    if hi - lo < 1e-12:
+        return [1.0 for _ in values]
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+def lexical_scores(query: str, texts: List[str], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """
+    BM25 of the query against the candidate set (idf computed over the candidates).
+    """
+    docs = [Counter(tokenize(t)) for t in texts]
+    lengths = [sum(d.values()) for d in docs]
+    avg_len = (sum(lengths) / len(lengths)) or 1.0
+    n = len(docs)
+    terms = set(tokenize(query))
+    scores = []
+    for doc, length in zip(docs, lengths):
+        score = 0.0
+        for term in terms:
+            tf = doc.get(term, 0)
+            if not tf:
+                continue
+            df = sum(1 for d in docs if term in d)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+        scores.append(score)
+    return scores
+
+
+def _get_cross_encoder():
+    """
+    Optional local CPU cross-encoder (sentence-transformers); None when not
+    configured or not installed.
+    """
+    global _cross_encoder, _cross_encoder_failed
+    if not settings.RERANK_MODEL or _cross_encoder_failed:
+        return None
+    if _cross_encoder is None:
+        try:
+            from sentence_transformers import CrossEncoder
+
+            _cross_encoder = CrossEncoder(settings.RERANK_MODEL, device="cpu")
+        except Exception as exc:
+            log.warning(f"[rerank] cross-encoder {settings.RERANK_MODEL} unavailable, using hybrid score: {exc}")
+            _cross_encoder_failed = True
+            return None
+    return _cross_encoder
+
+
+@traced("rerank")
+async def rerank(query: str, chunks: List[Dict], k: int) -> List[Dict]:
+    """
+    Reorder over-fetched candidates and keep the best `k`. With RERANK_MODEL
+    set, a cross-encoder scores (query, text) pairs; otherwise the score is a
+    blend of the normalized vector score and BM25 over the candidates
+    (RERANK_LEXICAL_WEIGHT).
+    """
+    if len(chunks) <= 1:
+        return chunks[:k]
+    texts = [c.get("text") or "" for c in chunks]
+
+    model = _get_cross_encoder()
+    if model is not None:
+        raw = await asyncio.to_thread(model.predict, [(query, t) for t in texts])
+        scores = [float(s) for s in raw]
+    else:
+        w = settings.RERANK_LEXICAL_WEIGHT
+        dense = _min_max([float(c.get("score") or 0.0) for c in chunks])
+        lexical = _min_max(lexical_scores(query, texts))
+        scores = [(1 - w) * d + w * l for d, l in zip(dense, lexical)]
+
+    ranked = sorted(zip(scores, chunks), key=lambda item: item[0], reverse=True)[:k]
+    return [dict(chunk, rerank_score=round(score, 4)) for score, chunk in ranked]
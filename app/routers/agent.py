@@ -1,8 +1,15 @@
+import json
 import logging
-from fastapi import APIRouter
+from typing import AsyncIterator
 
-from app.schemas.agent import AgentAnswer, AgentQuery
-from app.agents.graph import run_agent
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.schemas.agent import AgentAnswer, AgentQuery, BatchAnswer, BatchJob, BatchQuery, SessionInfo
+from app.agents import answer_cache, batch, language, sessions, single_flight
+from app.agents.graph import run_agent, stream_agent
+from app.clients.llm_scheduler import LLMOverloaded, get_llm_scheduler
+from app.config import settings
 
 router = APIRouter()
 log = logging.getLogger(__name__)
@@ -11,6 +18,95 @@ log = logging.getLogger(__name__)
 @router.post("/ask", response_model=AgentAnswer)
 async def ask_agent(payload: AgentQuery) -> AgentAnswer:
     log.info(f"[api] received question: {payload.question}")
-    result = await run_agent(payload.question)
+    result = await run_agent(payload.question, payload.session_id, payload.chat_history)
     log.info(f"[api] finished question, answer_len={len(result.get('answer',''))}, citations={len(result.get('citations',[]))}")
     return AgentAnswer(**result)
+
+
+async def _sse(payload: AgentQuery) -> AsyncIterator[str]:
+    try:
+        async for event, data in stream_agent(payload.question, payload.session_id, payload.chat_history):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+    except LLMOverloaded as exc:
+        log.warning(f"[api] stream rejected: {exc.detail}")
+        payload = {"detail": exc.detail, "retry_after": exc.retry_after}
+        yield f"event: error\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    except Exception as exc:
+        log.error(f"[api] stream failed: {exc}")
+        yield f"event: error\ndata: {json.dumps({'detail': str(exc)}, ensure_ascii=False)}\n\n"
+
+
+@router.post("/ask/stream")
+async def ask_agent_stream(payload: AgentQuery) -> StreamingResponse:
+    log.info(f"[api] received streaming question: {payload.question}")
+    # The status line goes out with the first event, so reject while we still can.
+    get_llm_scheduler().admit()
+    return StreamingResponse(
+        _sse(payload),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _check_batch(payload: BatchQuery) -> None:
+    if len(payload.questions) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_QUESTIONS} questions per batch")
+
+
+@router.post("/ask/batch", response_model=BatchAnswer)
+async def ask_batch(payload: BatchQuery) -> BatchAnswer:
+    _check_batch(payload)
+    log.info(f"[api] received batch of {len(payload.questions)} questions")
+    return BatchAnswer(**await batch.run_batch(payload.questions, payload.concurrency))
+
+
+@router.post("/ask/batch/jobs", response_model=BatchJob, status_code=202)
+async def ask_batch_job(payload: BatchQuery) -> BatchJob:
+    _check_batch(payload)
+    job_id = await batch.start_job(payload.questions, payload.concurrency)
+    log.info(f"[api] started batch job {job_id} with {len(payload.questions)} questions")
+    return BatchJob(**await batch.get_job(job_id))
+
+
+@router.get("/ask/batch/jobs/{job_id}", response_model=BatchJob)
+async def get_batch_job(job_id: str) -> BatchJob:
+    job = await batch.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return BatchJob(**job)
+
+
+@router.post("/sessions", response_model=SessionInfo, status_code=201)
+async def create_session() -> SessionInfo:
+    return SessionInfo(session_id=await sessions.create())
+
+
+@router.get("/sessions/{session_id}", response_model=SessionInfo)
+async def get_session(session_id: str) -> SessionInfo:
+    session = await sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    pinned = [{k: v for k, v in chunk.items() if k != "text"} for chunk in session["pinned"]]
+    return SessionInfo(session_id=session_id, turns=session["turns"], pinned=pinned)
+
+
+@router.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str) -> None:
+    await sessions.delete(session_id)
+
+
+@router.get("/cache/stats")
+async def cache_stats() -> dict:
+    stats = await answer_cache.get_stats()
+    stats["single_flight"] = await single_flight.get_stats()
+    return stats
+
+
+@router.get("/language/stats")
+async def language_stats() -> dict:
+    return await language.get_stats()
+
+
+@router.get("/llm/stats")
+async def llm_stats() -> dict:
+    return get_llm_scheduler().stats()
@@ -5,10 +5,53 @@ from pydantic import BaseModel, Field
 
 class AgentQuery(BaseModel):
     question: str = Field(..., description="Вопрос по теории управления")
-    chat_history: Optional[List[Dict[str, Any]]] = None
+    session_id: Optional[str] = Field(
+        None,
+        pattern=r"^[A-Za-z0-9_-]{1,64}$",
+        description="Сессия диалога: прошлые ходы и найденные фрагменты хранятся на сервере",
+    )
+    chat_history: Optional[List[Dict[str, Any]]] = Field(
+        None,
+        description="История без сессии: [{'role': 'user'|'assistant', 'content': ...}]",
+    )
 
 
 class AgentAnswer(BaseModel):
     answer: str
     citations: List[Dict[str, Any]] = []
     theory: str | None = None
+    session_id: str | None = None
+
+
+class SessionInfo(BaseModel):
+    session_id: str
+    turns: List[Dict[str, str]] = []
+    pinned: List[Dict[str, Any]] = []
+
+
+class BatchQuery(BaseModel):
+    questions: List[str] = Field(..., min_length=1, description="Вопросы; повторы отвечаются один раз")
+    concurrency: Optional[int] = Field(None, ge=1, description="Сколько вопросов обрабатывать параллельно")
+
+
+class BatchItem(AgentAnswer):
+    question: str
+    seconds: float
+    error: str | None = None
+
+
+class BatchAnswer(BaseModel):
+    results: List[BatchItem]
+    unique_questions: int
+    duplicates: int
+    timings: Dict[str, float]
+
+
+class BatchJob(BaseModel):
+    job_id: str
+    status: str | None = None
+    questions: int = 0
+    total: int = 0
+    completed: int = 0
+    error: str | None = None
+    result: BatchAnswer | None = None
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import mmap
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.clients.redis_client import get_async_redis, get_redis
+from app.config import settings
+
+
+class ChunkStore(ABC):
+    """
+    Where chunk texts live. Ingest calls `put` for every chunk (and may let the
+    store enrich the Qdrant payload), search calls `load` with raw Qdrant hits.
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    def put(self, chunk_id: str, text: str, payload: Dict) -> None:
+        ...
+
+    def remove(self, chunk_ids: List[str]) -> None:
+        pass
+
+    def reset(self) -> None:
+        """
+        Called before a full rebuild: everything stored so far is dropped.
+        """
+
+    def flush(self) -> None:
+        pass
+
+    def preload(self) -> None:
+        pass
+
+    @abstractmethod
+    async def load(self, points: List[Dict]) -> List[str]:
+        ...
+
+
+class PayloadChunkStore(ChunkStore):
+    """
+    Text is stored inline in the Qdrant payload and comes back with the search hit.
+    """
+
+    name = "payload"
+
+    def put(self, chunk_id: str, text: str, payload: Dict) -> None:
+        payload["text"] = text
+
+    async def load(self, points: List[Dict]) -> List[str]:
+        return [(point.get("payload") or {}).get("text") or "" for point in points]
+
+
+class FileChunkStore(ChunkStore):
+    """
+    Legacy layout: one CHUNKS_DIR/<chunk_id>.txt per chunk, path registered in Redis.
+    """
+
+    name = "files"
+
+    def __init__(self, chunks_dir: str):
+        self.chunks_dir = Path(chunks_dir)
+
+    def put(self, chunk_id: str, text: str, payload: Dict) -> None:
+        self.chunks_dir.mkdir(parents=True, exist_ok=True)
+        txt_path = self.chunks_dir / f"{chunk_id}.txt"
+        txt_path.write_text(text, encoding="utf-8")
+        get_redis().hset(
+            f"chunk:{chunk_id}",
+            mapping={
+                "path": str(txt_path),
+                "book_id": payload["book_id"],
+                "theory": payload["theory"],
+            },
+        )
+
+    def remove(self, chunk_ids: List[str]) -> None:
+        redis_client = get_redis()
+        for chunk_id in chunk_ids:
+            (self.chunks_dir / f"{chunk_id}.txt").unlink(missing_ok=True)
+            redis_client.delete(f"chunk:{chunk_id}")
+
+    @staticmethod
+    def _read_text(path: str) -> str:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    async def load(self, points: List[Dict]) -> List[str]:
+        # One pipelined round-trip for all hits instead of an HGETALL per hit.
+        async with get_async_redis().pipeline(transaction=False) as pipe:
+            for point in points:
+                pipe.hget(f"chunk:{point.get('id')}", "path")
+            paths = await pipe.execute()
+
+        async def read(path: Optional[str]) -> str:
+            if not path:
+                return ""
+            return await asyncio.to_thread(self._read_text, path)
+
+        return await asyncio.gather(*(read(path) for path in paths))
+
+
+class MmapChunkStore(ChunkStore):
+    """
+    Single append-only data file plus a JSON index {chunk_id: [offset, length]}.
+    The index is loaded once and the data file is memory-mapped, so a lookup is
+    a dict access and a slice. Re-ingested chunks are appended and the index
+    points at the newest copy; once dead bytes exceed
+    CHUNK_STORE_COMPACT_RATIO of the file, `flush` rewrites it with the live
+    chunks only. Rewritten files replace the old ones atomically (data first,
+    then index), so readers keep their mapping until they see the new index.
+    """
+
+    name = "mmap"
+
+    def __init__(self, chunks_dir: str):
+        self.data_path = Path(chunks_dir) / "chunks.bin"
+        self.index_path = Path(chunks_dir) / "chunks.idx.json"
+        self._index: Dict[str, List[int]] | None = None
+        self._index_mtime = 0.0
+        self._mm: mmap.mmap | None = None
+        self._writer = None
+        self._rewrite = False
+
+    def _read_index(self) -> Dict[str, List[int]]:
+        if not self.index_path.exists():
+            return {}
+        with self.index_path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _tmp_data_path(self) -> Path:
+        return self.data_path.with_suffix(".bin.tmp")
+
+    def _open_writer(self) -> None:
+        if self._writer is None:
+            self.data_path.parent.mkdir(parents=True, exist_ok=True)
+            self._index = self._read_index()
+            self._writer = self.data_path.open("ab")
+
+    def reset(self) -> None:
+        # New data goes to a fresh file that replaces chunks.bin on flush; the
+        # old one is never truncated in place under a reader's mapping.
+        if self._writer is not None:
+            self._writer.close()
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        self._index = {}
+        self._writer = self._tmp_data_path().open("wb")
+        self._rewrite = True
+
+    def put(self, chunk_id: str, text: str, payload: Dict) -> None:
+        self._open_writer()
+        data = text.encode("utf-8")
+        offset = self._writer.tell()
+        self._writer.write(data)
+        self._index[chunk_id] = [offset, len(data)]
+
+    def remove(self, chunk_ids: List[str]) -> None:
+        # Bytes stay in the data file until the next compaction.
+        self._open_writer()
+        for chunk_id in chunk_ids:
+            self._index.pop(chunk_id, None)
+
+    def _compact(self) -> None:
+        """
+        Copies the live chunks into a new data file (in offset order) and
+        rewrites the index to match.
+        """
+        index: Dict[str, List[int]] = {}
+        with self.data_path.open("rb") as src, self._tmp_data_path().open("wb") as dst:
+            for chunk_id, (offset, length) in sorted(self._index.items(), key=lambda item: item[1][0]):
+                src.seek(offset)
+                index[chunk_id] = [dst.tell(), length]
+                dst.write(src.read(length))
+            dst.flush()
+            os.fsync(dst.fileno())
+        self._index = index
+        self._rewrite = True
+
+    def flush(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._writer.close()
+        self._writer = None
+        if not self._rewrite:
+            size = self.data_path.stat().st_size
+            live = sum(length for _, length in self._index.values())
+            if size and (size - live) / size > settings.CHUNK_STORE_COMPACT_RATIO:
+                print(f"Compacting {self.data_path}: {size - live} of {size} bytes are dead")
+                self._compact()
+        if self._rewrite:
+            os.replace(self._tmp_data_path(), self.data_path)
+            self._rewrite = False
+        tmp = self.index_path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self.index_path)
+
+    def preload(self) -> None:
+        if not self.index_path.exists() or not self.data_path.exists():
+            self._index = {}
+            return
+        self._index_mtime = self.index_path.stat().st_mtime
+        self._index = self._read_index()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self.data_path.stat().st_size:
+            with self.data_path.open("rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _maybe_reload(self) -> None:
+        # Pick up a re-ingest done by another process without restarting the API.
+        if self._index is None:
+            self.preload()
+            return
+        try:
+            mtime = self.index_path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._index_mtime:
+            self.preload()
+
+    async def load(self, points: List[Dict]) -> List[str]:
+        self._maybe_reload()
+        texts = []
+        for point in points:
+            entry = self._index.get(str(point.get("id")))
+            if entry is None or self._mm is None:
+                texts.append("")
+                continue
+            offset, length = entry
+            texts.append(self._mm[offset:offset + length].decode("utf-8"))
+        return texts
+
+
+_store: ChunkStore | None = None
+
+
+def get_chunk_store() -> ChunkStore:
+    global _store
+    if _store is None:
+        backend = settings.CHUNK_STORE_BACKEND
+        if backend == "payload":
+            _store = PayloadChunkStore()
+        elif backend == "mmap":
+            _store = MmapChunkStore(settings.CHUNKS_DIR)
+        elif backend == "files":
+            _store = FileChunkStore(settings.CHUNKS_DIR)
+        else:
+            raise ValueError(f"Unknown CHUNK_STORE_BACKEND: {backend}")
+    return _store
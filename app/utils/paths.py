@@ -1,5 +1,8 @@
 from pathlib import Path
 
+# Book id -> theory; app.agents.router.THEORY_COLLECTIONS maps the theory to its collection.
+BOOK_THEORIES = {"cls_ogata": "linear", "ds_ogata": "discrete", "nl_khalil": "nonlinear"}
+
 
 def detect_theory_and_book(source_file: str) -> tuple[str, str]:
     """
@@ -0,0 +1,19 @@
+import re
+from typing import List
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap tokenizer-free estimate: words and punctuation marks.
+    """
+    return len(_TOKEN_RE.findall(text))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens for lexical scoring.
+    """
+    return _WORD_RE.findall(text.lower())
@@ -0,0 +1,178 @@
+import functools
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator
+
+from prometheus_client import Counter, Histogram
+
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+trace_id_var: ContextVar[str] = ContextVar("trace_id", default="-")
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "agent_stage_seconds",
+    "Latency of one pipeline stage (graph node, LLM call, embedding, search, cache, chunk load).",
+    ["stage", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+HTTP_SECONDS = Histogram(
+    "agent_http_request_seconds",
+    "HTTP request latency until the response is fully sent.",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "agent_llm_tokens_total",
+    "Tokens processed by Ollama, as reported in its responses.",
+    ["call", "kind"],
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "agent_llm_tokens_per_second",
+    "Generation speed (eval_count / eval_duration) of one LLM call.",
+    ["call"],
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200),
+)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def install_log_record_factory() -> None:
+    """
+    Every log record gets `trace_id` of the request it was emitted in.
+    """
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, "_with_trace_id", False):
+        return
+
+    def record_factory(*args: Any, **kwargs: Any) -> logging.LogRecord:
+        record = factory(*args, **kwargs)
+        record.trace_id = trace_id_var.get()
+        return record
+
+    record_factory._with_trace_id = True
+    logging.setLogRecordFactory(record_factory)
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Times a stage into agent_stage_seconds and logs it with the request's
+    trace id. The yielded dict can be filled with attributes for the log line.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage, status).observe(elapsed)
+        if settings.TRACE_LOG_SPANS:
+            details = " ".join(f"{key}={value}" for key, value in attrs.items())
+            log.info(f"[trace] {stage} {elapsed * 1000:.1f}ms {status} {details}".rstrip())
+
+
+def traced(stage: str) -> Callable:
+    """
+    `span` around every call of an async function.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(stage):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_llm_usage(call: str, metadata: Dict[str, Any] | None) -> Dict[str, Any]:
+    """
+    Token counts and durations from an Ollama chat response (response_metadata);
+    durations are reported by Ollama in nanoseconds.
+    """
+    metadata = metadata or {}
+    usage: Dict[str, Any] = {}
+    prompt_tokens = metadata.get("prompt_eval_count") or 0
+    eval_tokens = metadata.get("eval_count") or 0
+    if prompt_tokens:
+        LLM_TOKENS.labels(call, "prompt").inc(prompt_tokens)
+        usage["prompt_tokens"] = prompt_tokens
+    if eval_tokens:
+        LLM_TOKENS.labels(call, "eval").inc(eval_tokens)
+        usage["eval_tokens"] = eval_tokens
+    for field, stage in (
+        ("load_duration", "llm.load"),
+        ("prompt_eval_duration", "llm.prompt_eval"),
+        ("eval_duration", "llm.eval"),
+    ):
+        duration = metadata.get(field)
+        if duration:
+            STAGE_SECONDS.labels(stage, "ok").observe(duration / 1e9)
+            usage[f"{stage.split('.')[1]}_ms"] = round(duration / 1e6, 1)
+    eval_duration = metadata.get("eval_duration")
+    if eval_tokens and eval_duration:
+        tokens_per_second = eval_tokens / (eval_duration / 1e9)
+        LLM_TOKENS_PER_SECOND.labels(call).observe(tokens_per_second)
+        usage["tokens_per_sec"] = round(tokens_per_second, 1)
+    return usage
+
+
+def _route_label(scope: Dict[str, Any]) -> str:
+    # Path template of the matched route ("/v1/ask/batch/jobs/{job_id}"), so
+    # path parameters do not blow up label cardinality.
+    if scope.get("route") is None:
+        return "unmatched"
+    path = scope.get("path", "")
+    for name, value in (scope.get("path_params") or {}).items():
+        path = path.replace(f"/{value}", f"/{{{name}}}")
+    return path
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware: trace id per request (X-Request-ID if the client sent
+    one), echoed as X-Trace-Id, and request latency until the body is sent,
+    so streamed answers are measured to their last event.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        trace_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or new_trace_id()
+        token = trace_id_var.set(trace_id)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_trace_id(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers") or []) + [(b"x-trace-id", trace_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            HTTP_SECONDS.labels(scope.get("method", ""), _route_label(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
+            trace_id_var.reset(token)
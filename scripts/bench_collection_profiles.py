@@ -0,0 +1,214 @@
+"""
+Recall and latency of the Qdrant collection profiles (app/clients/qdrant_profiles.py).
+
+Every book collection is copied (vectors + payload) into one temporary
+collection per profile, `<collection>__bench_<profile>`. The copies are
+indexed regardless of their size, so HNSW and quantization are exercised
+even on a small corpus. Then the same queries run against every copy with
+the profile's search params.
+
+  recall@k - overlap of the top-k ids with an exact (brute-force) search
+             of the source collection, i.e. what the profile loses;
+  latency  - per query, through the REST client, after one warm-up pass;
+  ram_mb   - estimate of the vector index RAM (vectors, quantized copies,
+             HNSW links; payload not included).
+
+Queries are the eval questions of each book (embedded through Ollama), or
+--sample-queries stored vectors per collection (no Ollama needed).
+Answer quality per profile: set QDRANT_COLLECTION_PROFILE, re-run ingest
+and scripts/eval_retrieval.py.
+
+Usage:
+  python scripts/bench_collection_profiles.py
+  python scripts/bench_collection_profiles.py --profiles default,scalar,binary --sample-queries 200 --k 10
+  python scripts/bench_collection_profiles.py --out bench_profiles.json --keep
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from qdrant_client.http import models  # noqa: E402
+
+from app.agents.router import THEORY_COLLECTIONS  # noqa: E402
+from app.clients.embedding_cache import aembed_cached  # noqa: E402
+from app.clients.http_client import close_http_client  # noqa: E402
+from app.clients.qdrant_client import get_qdrant  # noqa: E402
+from app.clients.qdrant_profiles import PROFILES, apply_profile, estimate_ram_bytes, get_profile, search_params  # noqa: E402
+from app.clients.redis_client import close_async_redis  # noqa: E402
+from app.utils.paths import BOOK_THEORIES  # noqa: E402
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _read_points(client, collection: str, batch_size: int = 256) -> list:
+    points, offset = [], None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        points += batch
+        if offset is None:
+            return points
+
+
+def _build_copy(client, target: str, points: list, profile: dict, timeout: float) -> float:
+    """
+    Creates the profile copy and waits until every vector is indexed; returns
+    the build time in seconds.
+    """
+    started = time.perf_counter()
+    if client.collection_exists(target):
+        client.delete_collection(target)
+    apply_profile(client, target, len(points[0].vector), False, profile)
+    client.update_collection(
+        collection_name=target,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1),
+        hnsw_config=models.HnswConfigDiff(full_scan_threshold=1),
+    )
+    for i in range(0, len(points), 256):
+        client.upsert(
+            collection_name=target,
+            points=[models.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points[i:i + 256]],
+            wait=True,
+        )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = client.get_collection(target)
+        if info.status == models.CollectionStatus.GREEN and (info.indexed_vectors_count or 0) >= len(points):
+            break
+        time.sleep(0.5)
+    else:
+        print(f"Warning: {target} is not fully indexed after {timeout:.0f}s, results include unindexed segments")
+    return time.perf_counter() - started
+
+
+def _search_ids(client, collection: str, vector: list, k: int, params: models.SearchParams) -> list:
+    hits = client.query_points(
+        collection_name=collection,
+        query=vector,
+        limit=k,
+        search_params=params,
+        with_payload=False,
+    ).points
+    return [str(hit.id) for hit in hits]
+
+
+async def _queries(client, cases: list, sample: int, seed: int) -> dict:
+    """
+    collection -> query vectors.
+    """
+    queries = {}
+    rnd = random.Random(seed)
+    for book_id, theory in BOOK_THEORIES.items():
+        collection = THEORY_COLLECTIONS[theory]
+        if sample:
+            points = _read_points(client, collection)
+            queries[collection] = [p.vector for p in rnd.sample(points, min(sample, len(points)))]
+        else:
+            questions = [case["question"] for case in cases if case["book_id"] == book_id]
+            queries[collection] = await aembed_cached(questions) if questions else []
+    return queries
+
+
+def run_profile(client, name: str, queries: dict, truth: dict, args: argparse.Namespace) -> dict:
+    profile = get_profile(name)
+    params = models.SearchParams(**search_params(profile))
+    latencies, overlaps = [], []
+    points_total, build_seconds, ram = 0, 0.0, 0
+    for collection, vectors in queries.items():
+        if not vectors:
+            continue
+        points = _read_points(client, collection)
+        target = f"{collection}__bench_{name}"
+        build_seconds += _build_copy(client, target, points, profile, args.index_timeout)
+        points_total += len(points)
+        ram += estimate_ram_bytes(len(points), len(points[0].vector), profile)
+        for vector in vectors:
+            _search_ids(client, target, vector, args.k, params)  # warm-up
+        for _ in range(args.repeat):
+            for vector, expected in zip(vectors, truth[collection]):
+                t0 = time.perf_counter()
+                ids = _search_ids(client, target, vector, args.k, params)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                overlaps.append(len(set(ids) & set(expected)) / max(1, len(expected)))
+        if not args.keep:
+            client.delete_collection(target)
+    return {
+        "profile": name,
+        "points": points_total,
+        f"recall@{args.k}": round(statistics.mean(overlaps), 4) if overlaps else 0.0,
+        "latency_ms_mean": round(statistics.mean(latencies), 2) if latencies else 0.0,
+        "latency_ms_p50": round(_percentile(latencies, 0.5), 2) if latencies else 0.0,
+        "latency_ms_p95": round(_percentile(latencies, 0.95), 2) if latencies else 0.0,
+        "ram_mb": round(ram / 2**20, 1),
+        "build_seconds": round(build_seconds, 1),
+        "search_params": search_params(profile),
+    }
+
+
+async def run(args: argparse.Namespace) -> list:
+    client = get_qdrant()
+    with open(args.questions, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    queries = await _queries(client, cases, args.sample_queries, args.seed)
+    exact = models.SearchParams(exact=True)
+    truth = {
+        collection: [_search_ids(client, collection, vector, args.k, exact) for vector in vectors]
+        for collection, vectors in queries.items()
+    }
+    return [run_profile(client, name, queries, truth, args) for name in args.profiles.split(",")]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", default=",".join(PROFILES), help=f"Comma-separated (default: {','.join(PROFILES)}).")
+    parser.add_argument("--k", type=int, default=5, help="Cut-off for recall@k (default: 5).")
+    parser.add_argument("--questions", default=str(ROOT / "scripts" / "eval_questions.json"))
+    parser.add_argument("--sample-queries", type=int, default=0, help="Use N stored vectors per collection as queries.")
+    parser.add_argument("--repeat", type=int, default=3, help="Measured passes over the queries (default: 3).")
+    parser.add_argument("--index-timeout", type=float, default=300.0, help="Seconds to wait for indexing per copy.")
+    parser.add_argument("--keep", action="store_true", help="Keep the __bench_ collections.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    async def go() -> list:
+        try:
+            return await run(args)
+        finally:
+            await close_http_client()
+            await close_async_redis()
+
+    results = asyncio.run(go())
+    print(f"k={args.k}, recall against exact search of the source collections")
+    for row in results:
+        print(
+            f"{row['profile']:11s} recall@{args.k} {row[f'recall@{args.k}']:.3f}  "
+            f"latency mean {row['latency_ms_mean']:.2f} ms, p50 {row['latency_ms_p50']:.2f} ms, "
+            f"p95 {row['latency_ms_p95']:.2f} ms  ram ~{row['ram_mb']:.1f} MB  build {row['build_seconds']:.1f}s"
+        )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"k": args.k, "profiles": results}, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
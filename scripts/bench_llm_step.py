@@ -0,0 +1,93 @@
+"""
+Per-step overhead of getting the tool-bound chat model.
+
+  before - what every graph step did: a new ChatOllama (new Ollama clients
+           and connection pools) + bind_tools(TOOLS)
+  after  - the process-wide client and the tool binding built once
+
+Offline mode measures only client construction + binding. --live also
+sends a one-token chat request per step to OLLAMA_BASE_URL, so connection
+setup (new pool vs kept-alive connection) is included.
+
+Usage:
+  python scripts/bench_llm_step.py --steps 200
+  python scripts/bench_llm_step.py --live --steps 20 --out bench_llm_step.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from app.agents.graph import close_llm_clients, get_llm_with_tools  # noqa: E402
+from app.agents.tools import TOOLS  # noqa: E402
+from app.clients.ollama_client import build_llm  # noqa: E402
+
+
+def _summary(mode: str, samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mode": mode,
+        "steps": len(samples),
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+    }
+
+
+async def run(steps: int, live: bool) -> list:
+    message = [HumanMessage(content="Reply with one word: ok")]
+
+    async def step(llm) -> None:
+        if live:
+            await llm.ainvoke(message, num_predict=1)
+
+    before = []
+    for _ in range(steps):
+        t0 = time.perf_counter()
+        llm = build_llm().bind_tools(TOOLS)
+        await step(llm)
+        before.append((time.perf_counter() - t0) * 1000)
+
+    await close_llm_clients()
+    get_llm_with_tools()  # built at startup in the API, not per step
+    after = []
+    for _ in range(steps):
+        t0 = time.perf_counter()
+        llm = get_llm_with_tools()
+        await step(llm)
+        after.append((time.perf_counter() - t0) * 1000)
+    await close_llm_clients()
+    return [_summary("before", before), _summary("after", after)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=200, help="Graph steps to simulate (default: 200).")
+    parser.add_argument("--live", action="store_true", help="Also send a one-token request to Ollama per step.")
+    parser.add_argument("--out", help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.steps, args.live))
+    for row in results:
+        print(
+            f"{row['mode']:7s} {row['steps']:5d} steps  mean {row['mean_ms']:9.3f} ms  "
+            f"p50 {row['p50_ms']:9.3f} ms  p95 {row['p95_ms']:9.3f} ms"
+        )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"live": args.live, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
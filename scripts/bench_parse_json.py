@@ -0,0 +1,162 @@
+"""
+Peak RSS / throughput of the recognition JSON loaders.
+
+Each loader runs in a fresh subprocess so peak RSS is not shared:
+  json    - previous loader: json.load of the whole file, pages sorted and copied
+  orjson  - load_document below INGEST_STREAM_MIN_BYTES (one-shot orjson)
+  stream  - load_document above INGEST_STREAM_MIN_BYTES (ijson, page by page)
+
+Usage:
+  python scripts/bench_parse_json.py results/recognition_json/CLS-Ogata-10-40.json
+  python scripts/bench_parse_json.py --synthetic-pages 5000   # generate a large file
+  python scripts/bench_parse_json.py FILE --out bench_parse.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+MODES = ("json", "orjson", "stream")
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(mode: str, path: Path) -> dict:
+    sys.path.insert(0, str(ROOT))
+    from app.ingestion.chunking import build_chunks_from_pages
+    from app.ingestion.parse_json import load_document
+    from app.utils.paths import detect_theory_and_book
+
+    base_rss = _rss_mb()
+    started = time.perf_counter()
+    if mode == "json":
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        theory, book_id = detect_theory_and_book(data["source_file"])
+        doc = {
+            "json_path": path,
+            "source_file": data["source_file"],
+            "theory": theory,
+            "book_id": book_id,
+            "pages": sorted(data["pages"], key=lambda p: p["page_number"]),
+        }
+        pages = len(doc["pages"])
+    else:
+        doc = load_document(path)
+        pages = 0
+
+        def counted(it):
+            nonlocal pages
+            for page in it:
+                pages += 1
+                yield page
+
+        doc["pages"] = counted(doc["pages"])
+    chunks = build_chunks_from_pages(doc)
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "pages": pages,
+        "chunks": len(chunks),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(_rss_mb(), 1),
+        "peak_rss_over_baseline_mb": round(_rss_mb() - base_rss, 1),
+    }
+
+
+def write_synthetic(pages: int, elements: int, path: Path) -> None:
+    rnd = random.Random(0)
+    words = "system stability transfer function nyquist lyapunov controller sampling".split()
+    with path.open("w", encoding="utf-8") as f:
+        f.write('{"source_file": "CLS-Synthetic-1-1.pdf", "total_pages": %d, "pages": [' % pages)
+        for p in range(1, pages + 1):
+            page = {
+                "page_number": p,
+                "elements": [
+                    {
+                        "label": "para",
+                        "bbox": [rnd.random() * 500 for _ in range(4)],
+                        "reading_order": i,
+                        "text": " ".join(rnd.choice(words) for _ in range(60)),
+                    }
+                    for i in range(elements)
+                ],
+            }
+            if p > 1:
+                f.write(",")
+            f.write(json.dumps(page))
+        f.write("]}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*", help="Recognition JSON files.")
+    parser.add_argument("--synthetic-pages", type=int, default=0, help="Generate a synthetic file with N pages.")
+    parser.add_argument("--elements", type=int, default=30, help="Elements per synthetic page (default: 30).")
+    parser.add_argument("--out", help="Write results as JSON to this path.")
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker[0], Path(args.worker[1]))))
+        return
+
+    files = [Path(f) for f in args.files]
+    tmp = None
+    if args.synthetic_pages:
+        tmp = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+        tmp.close()
+        write_synthetic(args.synthetic_pages, args.elements, Path(tmp.name))
+        files.append(Path(tmp.name))
+    if not files:
+        parser.error("pass JSON files and/or --synthetic-pages")
+
+    results = []
+    try:
+        for path in files:
+            size_mb = path.stat().st_size / 2**20
+            print(f"\n=== {path.name} ({size_mb:.1f} MB) ===")
+            for mode in MODES:
+                env = dict(os.environ)
+                # orjson: never stream; stream: always stream.
+                env["INGEST_STREAM_MIN_BYTES"] = str(2**62 if mode == "orjson" else 0)
+                proc = subprocess.run(
+                    [sys.executable, __file__, "--worker", mode, str(path)],
+                    capture_output=True,
+                    text=True,
+                    env=env,
+                    check=True,
+                )
+                row = json.loads(proc.stdout.strip().splitlines()[-1])
+                row["file"] = str(path)
+                row["file_mb"] = round(size_mb, 1)
+                results.append(row)
+                print(
+                    f"{mode:7s} {row['seconds']:8.2f}s {row['pages_per_sec'] or 0:10.1f} pages/s "
+                    f"peak RSS {row['peak_rss_mb']:8.1f} MB (+{row['peak_rss_over_baseline_mb']:.1f} MB)"
+                )
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved {len(results)} rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Recall@k, MRR and latency of the production search path with dense-only and
+hybrid (dense + BM25, RRF) retrieval.
+
+Every question goes through `_search_collection`, exactly as a search tool
+call does: over-fetch RERANK_FETCH_K candidates, fuse, rerank to k. The only
+difference between the modes is HYBRID_SEARCH_ENABLED (toggled in-process);
+--no-rerank also turns RERANK_ENABLED off for both. Runs against the live
+Qdrant/Ollama from settings and the BM25 indexes written by ingest.
+
+Relevance comes from labels in the questions file, not from the chunk text:
+  "relevant_pages":     [[page_start, page_end], ...]  - a chunk is relevant
+                        when its page span overlaps one of the ranges;
+  "relevant_chunk_ids": ["<chunk_id>", ...].
+Questions without labels are skipped. To label them, --pool writes the union
+of the top-k chunks of both modes per question (pooling) with page spans and
+text; set "relevant": true on the relevant candidates and --apply-pool writes
+their page spans and chunk ids back into the questions file. Labels have to be
+judged against the ingested corpus, so the shipped questions start unlabelled.
+
+Query embeddings are computed (and cached) before the measured runs, so the
+latency is search + fusion + rerank only.
+
+Usage:
+  python scripts/eval_retrieval.py
+  python scripts/eval_retrieval.py --k 5 --questions scripts/eval_questions.json --out eval_retrieval.json
+  python scripts/eval_retrieval.py --pool eval_pool.json
+  python scripts/eval_retrieval.py --apply-pool eval_pool.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.agents.router import THEORY_COLLECTIONS  # noqa: E402
+from app.agents.tools import _search_collection  # noqa: E402
+from app.clients.embedding_cache import aembed_cached  # noqa: E402
+from app.clients.http_client import close_http_client  # noqa: E402
+from app.clients.redis_client import close_async_redis  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.retrieval.bm25 import get_bm25_index  # noqa: E402
+from app.utils.paths import BOOK_THEORIES  # noqa: E402
+
+MODES = {"dense": False, "hybrid": True}
+
+
+def _is_labelled(case: dict) -> bool:
+    return bool(case.get("relevant_pages") or case.get("relevant_chunk_ids"))
+
+
+def _is_relevant(chunk: dict, case: dict) -> bool:
+    if chunk.get("chunk_id") in set(case.get("relevant_chunk_ids") or []):
+        return True
+    if chunk.get("page_start") is None:
+        return False
+    return any(
+        chunk["page_start"] <= end and chunk["page_end"] >= start
+        for start, end in case.get("relevant_pages") or []
+    )
+
+
+def _collection(book_id: str) -> str:
+    return THEORY_COLLECTIONS[BOOK_THEORIES[book_id]]
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def _search(case: dict, k: int, hybrid: bool) -> tuple:
+    settings.HYBRID_SEARCH_ENABLED = hybrid
+    t0 = time.perf_counter()
+    chunks = await _search_collection(_collection(case["book_id"]), case["question"], k)
+    return chunks, (time.perf_counter() - t0) * 1000
+
+
+async def run(cases: list, k: int) -> dict:
+    rows = {mode: {"hits": 0, "rr": [], "latency_ms": [], "misses": []} for mode in MODES}
+    for case in cases:
+        for mode, hybrid in MODES.items():
+            chunks, latency = await _search(case, k, hybrid)
+            rows[mode]["latency_ms"].append(latency)
+            rank = next((i for i, chunk in enumerate(chunks, 1) if _is_relevant(chunk, case)), None)
+            rows[mode]["rr"].append(1.0 / rank if rank else 0.0)
+            if rank:
+                rows[mode]["hits"] += 1
+            else:
+                rows[mode]["misses"].append(case["id"])
+
+    summary = {}
+    for mode, row in rows.items():
+        latency = row["latency_ms"]
+        summary[mode] = {
+            f"recall@{k}": round(row["hits"] / len(cases), 3),
+            "mrr": round(statistics.mean(row["rr"]), 3),
+            "latency_ms_mean": round(statistics.mean(latency), 1),
+            "latency_ms_p50": round(_percentile(latency, 0.5), 1),
+            "latency_ms_p95": round(_percentile(latency, 0.95), 1),
+            "misses": row["misses"],
+        }
+    return summary
+
+
+async def pool(cases: list, k: int) -> list:
+    """
+    Top-k candidates of every mode per question, merged by chunk id.
+    """
+    pooled = []
+    for case in cases:
+        candidates: dict = {}
+        for mode, hybrid in MODES.items():
+            chunks, _ = await _search(case, k, hybrid)
+            for rank, chunk in enumerate(chunks, 1):
+                item = candidates.setdefault(
+                    chunk["chunk_id"],
+                    {
+                        "chunk_id": chunk["chunk_id"],
+                        "page_start": chunk.get("page_start"),
+                        "page_end": chunk.get("page_end"),
+                        "ranks": {},
+                        "text": chunk.get("text") or "",
+                        "relevant": None,
+                    },
+                )
+                item["ranks"][mode] = rank
+        pooled.append(
+            {
+                "id": case["id"],
+                "book_id": case["book_id"],
+                "question": case["question"],
+                "candidates": sorted(candidates.values(), key=lambda c: min(c["ranks"].values())),
+            }
+        )
+    return pooled
+
+
+def apply_pool(cases: list, pooled: list) -> int:
+    """
+    Copies the candidates judged "relevant": true into relevant_pages and
+    relevant_chunk_ids of their questions. Returns the number of labelled
+    questions; questions without a judged candidate keep their labels.
+    """
+    by_id = {case["id"]: case for case in cases}
+    labelled = 0
+    for entry in pooled:
+        case = by_id.get(entry["id"])
+        relevant = [c for c in entry["candidates"] if c.get("relevant") is True]
+        if case is None or not relevant:
+            continue
+        case["relevant_chunk_ids"] = sorted({c["chunk_id"] for c in relevant})
+        spans = {(c["page_start"], c["page_end"]) for c in relevant if c.get("page_start") is not None}
+        case["relevant_pages"] = [list(span) for span in sorted(spans)]
+        labelled += 1
+    return labelled
+
+
+async def prepare(cases: list) -> None:
+    # Warm the embedding cache and load the BM25 indexes outside the measurements.
+    await aembed_cached([case["question"] for case in cases])
+    for book_id in {case["book_id"] for case in cases}:
+        await get_bm25_index(_collection(book_id))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", default=str(ROOT / "scripts" / "eval_questions.json"))
+    parser.add_argument("--k", type=int, default=5, help="Cut-off for recall@k (default: 5).")
+    parser.add_argument("--no-rerank", action="store_true", help="Measure without the rerank stage.")
+    parser.add_argument("--pool", help="Write pooled candidates for labelling to this path and exit.")
+    parser.add_argument(
+        "--apply-pool", help="Write the candidates judged relevant in this pool file into --questions and exit."
+    )
+    parser.add_argument("--out", help="Write results as JSON to this path.")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    if args.no_rerank:
+        settings.RERANK_ENABLED = False
+
+    if args.apply_pool:
+        with open(args.apply_pool, "r", encoding="utf-8") as f:
+            labelled = apply_pool(cases, json.load(f))
+        with open(args.questions, "w", encoding="utf-8") as f:
+            # One question per line, like the shipped file.
+            f.write("[\n" + ",\n".join(f"  {json.dumps(case, ensure_ascii=False)}" for case in cases) + "\n]\n")
+        print(f"Labelled {labelled} questions in {args.questions}")
+        return
+
+    if args.pool:
+        async def go_pool() -> list:
+            try:
+                await prepare(cases)
+                return await pool(cases, args.k)
+            finally:
+                await close_http_client()
+                await close_async_redis()
+
+        pooled = asyncio.run(go_pool())
+        with open(args.pool, "w", encoding="utf-8") as f:
+            json.dump(pooled, f, ensure_ascii=False, indent=2)
+        print(f"Saved pooled candidates of {len(pooled)} questions to {args.pool}")
+        return
+
+    labelled = [case for case in cases if _is_labelled(case)]
+    if not labelled:
+        sys.exit(
+            f"No question in {args.questions} has relevant_pages/relevant_chunk_ids; "
+            f"label them first (--pool, then --apply-pool)."
+        )
+
+    async def go() -> dict:
+        try:
+            await prepare(labelled)
+            return await run(labelled, args.k)
+        finally:
+            await close_http_client()
+            await close_async_redis()
+
+    summary = asyncio.run(go())
+    print(
+        f"{len(labelled)} labelled questions ({len(cases) - len(labelled)} skipped), k={args.k}, "
+        f"fetch_k={settings.RERANK_FETCH_K if settings.RERANK_ENABLED else args.k}, "
+        f"rerank={'on' if settings.RERANK_ENABLED else 'off'}"
+    )
+    for mode, row in summary.items():
+        print(
+            f"{mode:7s} recall@{args.k} {row[f'recall@{args.k}']:.3f}  MRR {row['mrr']:.3f}  "
+            f"latency mean {row['latency_ms_mean']:.1f} ms, p50 {row['latency_ms_p50']:.1f} ms, "
+            f"p95 {row['latency_ms_p95']:.1f} ms"
+        )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "k": args.k,
+                    "rerank": settings.RERANK_ENABLED,
+                    "questions": len(labelled),
+                    "modes": summary,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        print(f"\nSaved results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
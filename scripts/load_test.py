@@ -0,0 +1,659 @@
+"""
+Offline load test of /v1/ask with local stand-ins for Ollama, Qdrant and Redis.
+
+The real FastAPI app, graph, retrieval and caching code run in-process; only
+the services behind them are replaced:
+  Ollama  - /api/embed returns deterministic hash-seeded vectors; the chat
+            model is a scripted stand-in (first step: a search tool call,
+            next step: a Russian answer) that sleeps according to a
+            per-token latency model and reports Ollama-style token counts;
+  Qdrant  - an in-memory synthetic corpus (3 collections) behind the REST
+            endpoints the app calls, with a fixed latency per request;
+  Redis   - an in-memory subset of the commands the app uses (no expiry).
+BM25 indexes and router centroids are built for the synthetic corpus in a
+temporary directory. Nothing needs a GPU or network.
+
+Load is either closed-loop (--concurrency workers back to back) or
+open-loop (--rate Poisson arrivals per second, latency counted from the
+arrival). The report has p50/p95/p99 latency, throughput, errors and the
+per-stage breakdown from the app's own agent_stage_seconds histogram.
+--follow-ups N turns every request into a session conversation and reports
+first turns and follow-ups separately.
+
+Usage:
+  python scripts/load_test.py --requests 200 --concurrency 8
+  python scripts/load_test.py --requests 300 --rate 20 --out load.json
+  python scripts/load_test.py --requests 50 --concurrency 4 --follow-ups 2
+  python scripts/load_test.py --requests 200 --concurrency 8 --baseline load.json --max-regression 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+FAKE_OLLAMA = "http://fake-ollama:11434"
+FAKE_QDRANT = "http://fake-qdrant:6333"
+DIM = 64
+WORDS = (
+    "system control stability response frequency signal input output gain feedback loop matrix state "
+    "equation solution plant controller error time continuous discrete sampling model linear function"
+).split()
+
+
+def configure_env(workdir: str, args: argparse.Namespace) -> None:
+    # Settings are read once at import time, so this runs before any app import.
+    os.environ.update(
+        {
+            "OLLAMA_BASE_URL": FAKE_OLLAMA,
+            "QDRANT_URL": FAKE_QDRANT,
+            "REDIS_URL": "redis://fake-redis:6379/0",
+            "CHUNKS_DIR": workdir,
+            "BM25_INDEX_DIR": os.path.join(workdir, "bm25"),
+            "ROUTER_CENTROIDS_PATH": os.path.join(workdir, "router_centroids.json"),
+            "CHUNK_STORE_BACKEND": "payload",
+            "ANSWER_CACHE_ENABLED": str(args.answer_cache).lower(),
+            "OLLAMA_WARMUP_ON_STARTUP": "false",
+            "TRACE_LOG_SPANS": "false",
+            "RERANK_MODEL": "",
+        }
+    )
+
+
+def fake_vector(text: str) -> List[float]:
+    rnd = random.Random(hashlib.sha1(text.encode("utf-8")).digest())
+    vector = [rnd.gauss(0.0, 1.0) for _ in range(DIM)]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+class LatencyModel:
+    def __init__(self, scale: float):
+        self.scale = scale
+
+    async def sleep(self, ms: float) -> None:
+        if ms > 0 and self.scale > 0:
+            await asyncio.sleep(ms * self.scale / 1000)
+
+    def sleep_sync(self, ms: float) -> None:
+        if ms > 0 and self.scale > 0:
+            time.sleep(ms * self.scale / 1000)
+
+
+# --- Redis -------------------------------------------------------------------
+
+
+class FakePubSub:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.channels: List[str] = []
+
+    async def subscribe(self, channel: str) -> None:
+        self.redis.subscribers.setdefault(channel, []).append(self.queue)
+        self.channels.append(channel)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def unsubscribe(self, channel: str) -> None:
+        if self.queue in self.redis.subscribers.get(channel, []):
+            self.redis.subscribers[channel].remove(self.queue)
+
+    async def aclose(self) -> None:
+        for channel in self.channels:
+            await self.unsubscribe(channel)
+
+
+class FakePipeline:
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.calls: List[tuple] = []
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+    def __getattr__(self, name: str):
+        def queue(*args: Any, **kwargs: Any) -> "FakePipeline":
+            self.calls.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> List[Any]:
+        results = [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+        self.calls = []
+        return results
+
+
+class FakeRedis:
+    def __init__(self, latency: LatencyModel, ms: float):
+        self.latency = latency
+        self.ms = ms
+        self.kv: Dict[str, Any] = {}
+        self.hashes: Dict[str, Dict[str, Any]] = {}
+        self.subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def _rtt(self) -> None:
+        await self.latency.sleep(self.ms)
+
+    async def get(self, key: str):
+        await self._rtt()
+        return self.kv.get(key)
+
+    async def mget(self, keys: List[str]):
+        await self._rtt()
+        return [self.kv.get(key) for key in keys]
+
+    async def set(self, key: str, value: Any, ex: int | None = None, nx: bool = False):
+        await self._rtt()
+        if nx and key in self.kv:
+            return None
+        self.kv[key] = value
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        await self._rtt()
+        return sum(1 for key in keys if self.kv.pop(key, None) is not None or self.hashes.pop(key, None) is not None)
+
+    async def exists(self, key: str) -> int:
+        await self._rtt()
+        return int(key in self.kv or key in self.hashes)
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        return True
+
+    async def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        await self._rtt()
+        values = self.hashes.setdefault(key, {})
+        values[field] = int(values.get(field, 0)) + amount
+        return values[field]
+
+    async def hset(self, key: str, field: str | None = None, value: Any = None, mapping: Dict | None = None) -> int:
+        await self._rtt()
+        values = self.hashes.setdefault(key, {})
+        if field is not None:
+            values[field] = value
+        values.update(mapping or {})
+        return 1
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        await self._rtt()
+        return {field: str(value) for field, value in self.hashes.get(key, {}).items()}
+
+    async def publish(self, channel: str, message: Any) -> int:
+        await self._rtt()
+        queues = self.subscribers.get(channel, [])
+        for queue in queues:
+            queue.put_nowait({"type": "message", "channel": channel, "data": message})
+        return len(queues)
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self)
+
+    def pipeline(self, transaction: bool = False) -> FakePipeline:
+        return FakePipeline(self)
+
+    async def aclose(self) -> None:
+        return None
+
+
+# --- Qdrant + Ollama embeddings ---------------------------------------------
+
+
+def build_corpus(questions: List[Dict], chunks_per_collection: int) -> Dict[str, List[Dict]]:
+    from app.agents.router import THEORY_COLLECTIONS
+    from app.utils.hashing import make_chunk_id
+    from app.utils.paths import BOOK_THEORIES
+
+    rnd = random.Random(0)
+    by_book: Dict[str, List[Dict]] = {}
+    for case in questions:
+        by_book.setdefault(case["book_id"], []).append(case)
+    corpus: Dict[str, List[Dict]] = {}
+    for book_id, theory in BOOK_THEORIES.items():
+        collection = THEORY_COLLECTIONS[theory]
+        points = []
+        terms = [term for case in by_book.get(book_id, []) for term in case["must_contain"]]
+        for i in range(chunks_per_collection):
+            words = [rnd.choice(WORDS) for _ in range(150)]
+            if terms and i % 3 == 0:
+                words[rnd.randrange(len(words))] = terms[i % len(terms)]
+            text = " ".join(words)
+            page = 10 + i // 2
+            points.append(
+                {
+                    "id": make_chunk_id(f"{collection}:{i}"),
+                    "vector": fake_vector(text),
+                    "payload": {
+                        "chunk_id": make_chunk_id(f"{collection}:{i}"),
+                        "book_id": book_id,
+                        "theory": theory,
+                        "page_start": page,
+                        "page_end": page + 1,
+                        "text": text,
+                    },
+                }
+            )
+        corpus[collection] = points
+    return corpus
+
+
+def build_indexes(corpus: Dict[str, List[Dict]]) -> None:
+    from app.agents.router import save_centroids
+    from app.retrieval.bm25 import BM25Index, index_path
+
+    centroids = {}
+    for collection, points in corpus.items():
+        index = BM25Index()
+        for point in points:
+            index.add(point["id"], point["payload"]["text"])
+        index.save(index_path(collection))
+        theory = points[0]["payload"]["theory"]
+        centroids[theory] = [sum(p["vector"][d] for p in points) / len(points) for d in range(DIM)]
+    save_centroids(centroids)
+
+
+class FakeServices:
+    """
+    httpx MockTransport handler for the Ollama embedding and Qdrant REST calls.
+    """
+
+    def __init__(self, corpus: Dict[str, List[Dict]], latency: LatencyModel, args: argparse.Namespace):
+        self.corpus = corpus
+        self.by_id = {p["id"]: p for points in corpus.values() for p in points}
+        self.latency = latency
+        self.args = args
+
+    def _search(self, collection: str, vector: List[float], limit: int) -> List[Dict]:
+        points = self.corpus.get(collection)
+        if points is None:
+            return []
+        scored = sorted(
+            ((sum(a * b for a, b in zip(vector, p["vector"])), p) for p in points),
+            key=lambda item: item[0],
+            reverse=True,
+        )[:limit]
+        return [{"id": p["id"], "score": score, "payload": p["payload"]} for score, p in scored]
+
+    async def __call__(self, request):
+        import httpx
+
+        url = str(request.url)
+        body = json.loads(request.content or b"{}")
+        if url.startswith(FAKE_OLLAMA):
+            if request.url.path == "/api/embed":
+                texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                await self.latency.sleep(self.args.embed_ms + self.args.embed_ms_per_text * len(texts))
+                return httpx.Response(200, json={"embeddings": [fake_vector(t) for t in texts]})
+            return httpx.Response(200, json={"done": True})
+
+        await self.latency.sleep(self.args.qdrant_ms)
+        match = re.match(r"/collections/([^/]+)(/.*)?$", request.url.path)
+        if not match:
+            return httpx.Response(404, json={"status": "not found"})
+        collection, rest = match.group(1), match.group(2) or ""
+        if collection not in self.corpus:
+            # answer_cache collection: always empty, accepts writes.
+            if request.method == "GET":
+                return httpx.Response(404, json={"status": "not found"})
+            return httpx.Response(200, json={"result": [] if rest.endswith("/search") else True})
+        if rest == "/points/search":
+            return httpx.Response(200, json={"result": self._search(collection, body["vector"], body["limit"])})
+        if rest == "/points/search/batch":
+            results = [self._search(collection, s["vector"], s["limit"]) for s in body["searches"]]
+            return httpx.Response(200, json={"result": results})
+        if rest == "/points":
+            points = [self.by_id[i] for i in body.get("ids", []) if i in self.by_id]
+            return httpx.Response(
+                200, json={"result": [{"id": p["id"], "payload": p["payload"], "vector": p["vector"]} for p in points]}
+            )
+        return httpx.Response(404, json={"status": "not found"})
+
+
+# --- Chat model --------------------------------------------------------------
+
+
+def build_chat_model(latency: LatencyModel, args: argparse.Namespace):
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    from app.agents.sessions import PINNED_HEADER
+    from app.utils.tokens import estimate_tokens
+
+    answer = (
+        "Устойчивость системы определяется расположением полюсов передаточной функции: все полюса должны "
+        "лежать в левой полуплоскости. Для дискретных систем аналогичное условие — полюса внутри единичной "
+        "окружности. [{book}, {pages}]"
+    )
+
+    recent_prompts: deque = deque(maxlen=args.llm_cache_slots)
+
+    class ScriptedChatModel(BaseChatModel):
+        """
+        First step: one search tool call; with tool results in the history or
+        session chunks pinned in the system message: a Russian answer citing
+        the first chunk. Sleeps prompt_tokens * prompt_ms + eval_tokens * eval_ms,
+        where like in Ollama only the part of the prompt after the longest
+        prefix shared with one of the last --llm-cache-slots prompts is evaluated.
+        """
+
+        @property
+        def _llm_type(self) -> str:
+            return "scripted"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _script(self, messages) -> tuple:
+            """
+            The scripted reply and its simulated duration in ms.
+            """
+            prompt = "\n".join(f"{m.type}: {m.content}" for m in messages)
+            shared = max((len(os.path.commonprefix([prompt, p])) for p in recent_prompts), default=0)
+            recent_prompts.append(prompt)
+            prompt_tokens = estimate_tokens(prompt[shared:])
+            tool_messages = [m for m in messages if isinstance(m, ToolMessage)]
+            question = [m for m in messages if isinstance(m, HumanMessage)][-1].content
+            system = str(messages[0].content)
+            pinned = system.split(PINNED_HEADER, 1)[1] if PINNED_HEADER in system else None
+            if not tool_messages and pinned is None:
+                message = AIMessage(
+                    content="",
+                    tool_calls=[{"name": "search_all", "args": {"query": question}, "id": "call_1", "type": "tool_call"}],
+                )
+                eval_tokens = 20
+            else:
+                try:
+                    first = json.loads(tool_messages[-1].content if tool_messages else pinned)[0]
+                    book, pages = first.get("book_id"), f"{first.get('page_start')}-{first.get('page_end')}"
+                except (ValueError, IndexError, KeyError, AttributeError):
+                    book, pages = "unknown", "-"
+                message = AIMessage(content=answer.format(book=book, pages=pages))
+                eval_tokens = estimate_tokens(message.content)
+            prompt_s = prompt_tokens * args.llm_prompt_ms_per_token / 1000
+            eval_s = eval_tokens * args.llm_eval_ms_per_token / 1000
+            message.response_metadata = {
+                "prompt_eval_count": prompt_tokens,
+                "eval_count": eval_tokens,
+                "prompt_eval_duration": int(prompt_s * latency.scale * 1e9),
+                "eval_duration": int(eval_s * latency.scale * 1e9),
+            }
+            return ChatResult(generations=[ChatGeneration(message=message)]), (prompt_s + eval_s) * 1000
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            result, ms = self._script(messages)
+            latency.sleep_sync(ms)
+            return result
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            result, ms = self._script(messages)
+            await latency.sleep(ms)
+            return result
+
+    return ScriptedChatModel()
+
+
+# --- Load driver -------------------------------------------------------------
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def stage_samples() -> Dict[str, Dict[str, float]]:
+    from prometheus_client import REGISTRY
+
+    stages: Dict[str, Dict[str, float]] = {}
+    for metric in REGISTRY.collect():
+        if metric.name != "agent_stage_seconds":
+            continue
+        for sample in metric.samples:
+            stage = stages.setdefault(sample.labels["stage"], {"count": 0.0, "sum": 0.0})
+            if sample.name.endswith("_count"):
+                stage["count"] += sample.value
+            elif sample.name.endswith("_sum"):
+                stage["sum"] += sample.value
+    return stages
+
+
+FOLLOW_UPS = ["А подробнее?", "Приведи пример для этого случая.", "Почему это так?"]
+
+
+async def drive(client, questions: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    latencies: List[float] = []
+    follow_up_latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async def ask(payload: Dict[str, Any], arrived: float, into: List[float]) -> bool:
+        try:
+            resp = await client.post("/v1/ask", json=payload)
+        except Exception as exc:
+            statuses[type(exc).__name__] += 1
+            return False
+        statuses[str(resp.status_code)] += 1
+        if resp.status_code != 200:
+            return False
+        into.append((time.perf_counter() - arrived) * 1000)
+        return True
+
+    async def one(i: int, arrived: float) -> None:
+        question = questions[i % len(questions)]
+        if args.distinct:
+            question = f"{question} (#{i})"
+        if not args.follow_ups:
+            await ask({"question": question}, arrived, latencies)
+            return
+        # One conversation: the question, then follow-ups in the same session.
+        session_id = f"load-{args.seed}-{i}"
+        if not await ask({"question": question, "session_id": session_id}, arrived, latencies):
+            return
+        for turn in range(args.follow_ups):
+            payload = {"question": FOLLOW_UPS[turn % len(FOLLOW_UPS)], "session_id": session_id}
+            if not await ask(payload, time.perf_counter(), follow_up_latencies):
+                return
+
+    started = time.perf_counter()
+    if args.rate:
+        rnd = random.Random(args.seed)
+        tasks = []
+        next_arrival = started
+        for i in range(args.requests):
+            next_arrival += rnd.expovariate(args.rate)
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            tasks.append(asyncio.create_task(one(i, next_arrival)))
+        await asyncio.gather(*tasks)
+    else:
+        counter = iter(range(args.requests))
+
+        async def worker() -> None:
+            for i in counter:
+                await one(i, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - started
+
+    return {
+        "latencies": latencies,
+        "follow_up_latencies": follow_up_latencies,
+        "statuses": dict(statuses),
+        "wall_seconds": wall,
+    }
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "mean": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        "p50": round(percentile(latencies, 0.50), 1),
+        "p95": round(percentile(latencies, 0.95), 1),
+        "p99": round(percentile(latencies, 0.99), 1),
+        "max": round(max(latencies), 1) if latencies else 0.0,
+    }
+
+
+async def run(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    import httpx
+
+    from app.clients import http_client, ollama_client, redis_client
+    from app.main import app
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        cases = json.load(f)
+    latency = LatencyModel(args.time_scale)
+    corpus = build_corpus(cases, args.chunks)
+    build_indexes(corpus)
+
+    http_client._client = httpx.AsyncClient(transport=httpx.MockTransport(FakeServices(corpus, latency, args)))
+    redis_client._async_redis = FakeRedis(latency, args.redis_ms)
+    redis_client._async_redis_bytes = FakeRedis(latency, args.redis_ms)
+    ollama_client._llm = build_chat_model(latency, args)
+
+    before = stage_samples()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=None) as client:
+            if args.warmup:
+                for case in cases[: args.warmup]:
+                    await client.post("/v1/ask", json={"question": f"warm-up: {case['question']}"})
+                before = stage_samples()
+            outcome = await drive(client, [case["question"] for case in cases], args)
+        ollama_client._llm = None  # the stand-in has no HTTP clients to close
+    after = stage_samples()
+
+    latencies = outcome["latencies"] + outcome["follow_up_latencies"]
+    completed = len(latencies)
+    stages = {}
+    for stage, totals in sorted(after.items()):
+        count = totals["count"] - before.get(stage, {}).get("count", 0.0)
+        total = totals["sum"] - before.get(stage, {}).get("sum", 0.0)
+        if count:
+            stages[stage] = {
+                "count": int(count),
+                "mean_ms": round(total / count * 1000, 2),
+                "total_seconds": round(total, 3),
+            }
+    return {
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "requests", "concurrency", "rate", "distinct", "follow_ups", "answer_cache", "chunks", "time_scale",
+                "llm_prompt_ms_per_token", "llm_eval_ms_per_token", "llm_cache_slots", "embed_ms", "embed_ms_per_text",
+                "qdrant_ms", "redis_ms", "seed",
+            )
+        },
+        "requests": args.requests * (1 + args.follow_ups),
+        "completed": completed,
+        "statuses": outcome["statuses"],
+        "wall_seconds": round(outcome["wall_seconds"], 3),
+        "throughput_rps": round(completed / outcome["wall_seconds"], 2) if outcome["wall_seconds"] else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "latency_ms_by_turn": {
+            "first": latency_summary(outcome["latencies"]),
+            "follow_up": latency_summary(outcome["follow_up_latencies"]),
+        },
+        "stages": stages,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> bool:
+    """
+    Prints the change against a saved run; True when nothing regressed by
+    more than `max_regression` percent.
+    """
+    ok = True
+    print(f"\nAgainst baseline (max regression {max_regression:.0f}%):")
+    checks = [(f"latency p{q}", result["latency_ms"][f"p{q}"], baseline["latency_ms"][f"p{q}"], True) for q in (50, 95, 99)]
+    checks.append(("throughput", result["throughput_rps"], baseline["throughput_rps"], False))
+    for name, value, base, lower_is_better in checks:
+        change = (value - base) / base * 100 if base else 0.0
+        regressed = change > max_regression if lower_is_better else -change > max_regression
+        ok = ok and not regressed
+        print(f"  {name:14s} {base:10.1f} -> {value:10.1f} ({change:+.1f}%){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Requests to send (default: 200).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Closed-loop workers (default: 8).")
+    parser.add_argument("--rate", type=float, default=0.0, help="Open-loop Poisson arrivals per second (overrides --concurrency).")
+    parser.add_argument("--distinct", action="store_true", help="Make every question unique (no coalescing/caching).")
+    parser.add_argument(
+        "--follow-ups", type=int, default=0,
+        help="Turn every request into a session with this many follow-up questions (latency reported per turn).",
+    )
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache enabled.")
+    parser.add_argument("--questions", default=str(ROOT / "scripts" / "eval_questions.json"))
+    parser.add_argument("--chunks", type=int, default=300, help="Synthetic chunks per collection (default: 300).")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured requests before the run (default: 3).")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplier for every simulated latency.")
+    parser.add_argument("--llm-prompt-ms-per-token", type=float, default=0.2)
+    parser.add_argument("--llm-eval-ms-per-token", type=float, default=5.0)
+    parser.add_argument("--llm-cache-slots", type=int, default=4, help="Prompts kept for prefix reuse (default: 4).")
+    parser.add_argument("--embed-ms", type=float, default=5.0, help="Per embedding request.")
+    parser.add_argument("--embed-ms-per-text", type=float, default=0.5)
+    parser.add_argument("--qdrant-ms", type=float, default=3.0, help="Per Qdrant request.")
+    parser.add_argument("--redis-ms", type=float, default=0.2, help="Per Redis command.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results as JSON to this path.")
+    parser.add_argument("--baseline", help="Compare with a previous --out file; exit 1 on regression.")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="Allowed regression in percent (default: 10).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_env(workdir, args)
+        result = asyncio.run(run(args, workdir))
+
+    lat = result["latency_ms"]
+    print(
+        f"{result['completed']}/{result['requests']} ok in {result['wall_seconds']:.1f}s, "
+        f"{result['throughput_rps']:.2f} req/s, statuses {result['statuses']}"
+    )
+    print(f"latency ms: mean {lat['mean']:.1f}  p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  max {lat['max']:.1f}")
+    if args.follow_ups:
+        for turn, lat in result["latency_ms_by_turn"].items():
+            print(f"  {turn:9s}  mean {lat['mean']:.1f}  p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}")
+    print("\nstage                      count    mean ms    total s")
+    for stage, row in sorted(result["stages"].items(), key=lambda item: -item[1]["total_seconds"]):
+        print(f"{stage:24s} {row['count']:8d} {row['mean_ms']:10.2f} {row['total_seconds']:10.3f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved results to {args.out}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()